@@ -0,0 +1,147 @@
+from typing import Dict, Sequence
+import gzip
+import hashlib
+import mimetypes
+import os
+from starlette.requests import Request
+from starlette.responses import Response
+from sse import negotiate_encoding
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Unhashed URLs stay usable but must be revalidated
+REVALIDATE = "no-cache"
+
+ASSET_ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def minify_js(source: str) -> str:
+    """Conservatively shrink JavaScript.
+
+    Only drops comments that start a line, indentation and blank lines;
+    code after the end of a block comment is kept, and line breaks are kept
+    so automatic semicolon insertion behaves exactly as before.
+    """
+    lines = []
+    in_block_comment = False
+    for line in source.splitlines():
+        line = line.strip()
+        if in_block_comment:
+            end = line.find("*/")
+            if end < 0:
+                continue
+            in_block_comment = False
+            line = line[end + 2:].strip()
+        while line.startswith("/*"):
+            end = line.find("*/", 2)
+            if end < 0:
+                in_block_comment = True
+                line = ""
+                break
+            line = line[end + 2:].strip()
+        if not line or line.startswith("//"):
+            continue
+        lines.append(line)
+    return "\n".join(lines)
+
+
+class Asset:
+    """One build of a file: its hashed URL and every encoding of its bytes."""
+
+    def __init__(self, path: str, body: bytes, media_type: str, digest: str):
+        self.path = path
+        self.media_type = media_type
+        self.variants: Dict[str, bytes] = {"identity": body}
+        # Each encoding is a different representation and needs its own ETag
+        self.etags: Dict[str, str] = {"identity": f'"{digest}"'}
+        self._add_variant("gzip", "gz", gzip.compress(body, compresslevel=9, mtime=0), digest)
+        if brotli is not None:
+            self._add_variant("br", "br", brotli.compress(body, quality=11), digest)
+
+    def _add_variant(self, encoding: str, suffix: str, data: bytes, digest: str) -> None:
+        # Only worth serving when smaller than every variant we already have
+        if len(data) < min(len(variant) for variant in self.variants.values()):
+            self.variants[encoding] = data
+            self.etags[encoding] = f'"{digest}-{suffix}"'
+
+
+class StaticAssets:
+    """Fingerprinted static files served from memory.
+
+    ``build`` reads each file once, makes a minified build of scripts when
+    ``minify`` is set, and stores every build under a URL containing a hash
+    of its content along with precompressed gzip (and brotli, when
+    installed) variants, each kept only when it is smaller than the others.
+    Hashed URLs change whenever the content does, so they are cached by
+    browsers as immutable and repeat page loads make no request at all.
+    ``url`` gives the hashed URL for templates.
+    """
+
+    def __init__(self, directory: str, names: Sequence[str], prefix: str = "/static", minify: bool = True):
+        self._directory = directory
+        self._names = list(names)
+        self._prefix = prefix
+        self._minify = minify
+        self._urls: Dict[str, str] = {}
+        self._assets: Dict[str, Asset] = {}
+        # Logical name -> build served at the unhashed URL for older pages
+        self._unhashed: Dict[str, Asset] = {}
+
+    def build(self) -> None:
+        self._urls.clear()
+        self._assets.clear()
+        self._unhashed.clear()
+        for name in self._names:
+            with open(os.path.join(self._directory, name), "rb") as f:
+                body = f.read()
+            media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+            if media_type in ("application/javascript", "text/javascript"):
+                media_type = "text/javascript; charset=utf-8"
+
+            stem, ext = os.path.splitext(name)
+            original = self._add(f"{stem}.{{hash}}{ext}", body, media_type)
+            self._unhashed[name] = original
+            self._urls[name] = original.path
+            if self._minify and ext == ".js":
+                minified = minify_js(body.decode()).encode()
+                self._urls[name] = self._add(f"{stem}.{{hash}}.min{ext}", minified, media_type).path
+
+    def url(self, name: str) -> str:
+        """Get the fingerprinted URL to reference ``name`` by"""
+        if not self._urls:
+            self.build()
+        return self._urls[name]
+
+    def response(self, request: Request, path: str) -> Response:
+        """Serve the asset at ``path`` (relative to the prefix)"""
+        asset = self._assets.get(path)
+        cache_control = IMMUTABLE
+        if asset is None:
+            asset = self._unhashed.get(path)
+            cache_control = REVALIDATE
+        if asset is None:
+            return Response("Not Found", status_code=404)
+
+        encoding = negotiate_encoding(
+            request.headers.get("accept-encoding", ""),
+            [e for e in ASSET_ENCODINGS if e in asset.variants],
+        )
+        etag = asset.etags[encoding or "identity"]
+        headers = {"Cache-Control": cache_control, "ETag": etag, "Vary": "Accept-Encoding"}
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=headers)
+
+        if encoding is not None:
+            headers["Content-Encoding"] = encoding
+        return Response(asset.variants[encoding or "identity"], media_type=asset.media_type, headers=headers)
+
+    def _add(self, pattern: str, body: bytes, media_type: str) -> Asset:
+        digest = hashlib.sha256(body).hexdigest()[:12]
+        file_name = pattern.format(hash=digest)
+        asset = Asset(f"{self._prefix}/{file_name}", body, media_type, digest)
+        self._assets[file_name] = asset
+        return asset
@@ -0,0 +1,297 @@
+from typing import Awaitable, Callable, Dict, Optional, Set
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from models import Homepage, PostStore
+from persistence import WriteBehindStore
+
+HomepageFactory = Callable[[str], Awaitable[Homepage]]
+
+
+class SessionBackend:
+    """Where sessions live and how their updates reach streams.
+
+    Handlers look sessions up through ``get``/``create``, call ``save`` after
+    mutating one, and every frame a ``Homepage`` flushes goes through
+    ``publish``, which delivers it to whichever process holds the streams.
+    """
+
+    def __init__(self, factory: HomepageFactory):
+        self._factory = factory
+        self._sessions: Dict[str, Homepage] = {}
+
+    @property
+    def local_sessions(self) -> Dict[str, Homepage]:
+        """Sessions materialized in this process"""
+        return self._sessions
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        for homepage in self._sessions.values():
+            homepage.close_streams()
+        self._sessions.clear()
+
+    async def get(self, username: str) -> Optional[Homepage]:
+        raise NotImplementedError
+
+    async def create(self, username: str) -> Homepage:
+        raise NotImplementedError
+
+    async def remove(self, username: str) -> Optional[Homepage]:
+        raise NotImplementedError
+
+    async def evict(self, username: str) -> Optional[Homepage]:
+        """Release a session from this process's memory and close its streams"""
+        return self._drop_local(username)
+
+    async def save(self, homepage: Homepage) -> None:
+        pass
+
+    async def publish(self, username: str, frame: dict) -> None:
+        raise NotImplementedError
+
+    async def _materialize(self, username: str) -> Homepage:
+        homepage = await self._factory(username)
+        homepage._backend = self
+        self._sessions[username] = homepage
+        return homepage
+
+    def _drop_local(self, username: str) -> Optional[Homepage]:
+        homepage = self._sessions.pop(username, None)
+        if homepage:
+            homepage.close_streams()
+        return homepage
+
+
+class InProcessBackend(SessionBackend):
+    """Sessions and streams held in this process only (single worker).
+
+    With a ``store``, saved sessions are persisted write-behind and survive
+    restarts and eviction: a session missing from memory is hydrated from
+    the store the first time it is looked up.
+    """
+
+    def __init__(self, factory: HomepageFactory, store: Optional[WriteBehindStore] = None):
+        super().__init__(factory)
+        self._store = store
+
+    async def start(self) -> None:
+        if self._store is not None:
+            await self._store.start()
+
+    async def stop(self) -> None:
+        await super().stop()
+        if self._store is not None:
+            await self._store.stop()
+
+    async def get(self, username: str) -> Optional[Homepage]:
+        homepage = self._sessions.get(username)
+        if homepage is None and self._store is not None:
+            state = self._store.get(self._key(username))
+            if state is not None:
+                homepage = await self._materialize(username)
+                homepage._posts = PostStore.from_state(json.loads(state))
+        return homepage
+
+    async def create(self, username: str) -> Homepage:
+        homepage = await self.get(username)
+        if homepage is None:
+            homepage = await self._materialize(username)
+            await self.save(homepage)
+        return homepage
+
+    async def remove(self, username: str) -> Optional[Homepage]:
+        if self._store is not None:
+            self._store.delete(self._key(username))
+        return self._drop_local(username)
+
+    async def save(self, homepage: Homepage) -> None:
+        if self._store is not None:
+            # Serialized when flushed, once however many saves happen in between
+            self._store.put(self._key(homepage.username), lambda: json.dumps(homepage.posts.to_state()))
+
+    @staticmethod
+    def _key(username: str) -> str:
+        return f"session:{username}"
+
+    async def publish(self, username: str, frame: dict) -> None:
+        homepage = self._sessions.get(username)
+        if homepage is not None:
+            await homepage._enqueue(frame)
+
+
+class SQLiteBackend(SessionBackend):
+    """Sessions and events shared by every worker through a SQLite WAL database.
+
+    Session state is stored per username and reloaded on every ``get``, so a
+    POST can be handled by any worker. Published frames are appended to an
+    events table. The publishing worker delivers its own frames directly;
+    every other worker tails the table every ``poll_interval`` seconds and
+    delivers new frames to the streams it holds. A save merges the posts
+    added and deleted since the session was loaded into the stored ones in
+    a single write transaction, so concurrent saves from other workers
+    aren't lost, and new posts take their ids from the stored store so ids
+    stay unique across workers.
+
+    Queries are short local transactions and run on the event loop.
+    """
+
+    def __init__(
+        self,
+        factory: HomepageFactory,
+        path: str,
+        poll_interval: float = 0.02,
+        event_retention: float = 60.0,
+    ):
+        super().__init__(factory)
+        self._path = path
+        self._poll_interval = poll_interval
+        self._event_retention = event_retention
+        self._origin = f"{os.getpid()}:{id(self)}"
+        self._db: Optional[sqlite3.Connection] = None
+        self._last_event_id = 0
+        self._tailer: Optional[asyncio.Task] = None
+        # Post ids of each local session as last loaded or saved
+        self._loaded_ids: Dict[str, Set[int]] = {}
+
+    async def start(self) -> None:
+        self._db = sqlite3.connect(self._path, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA busy_timeout=5000")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "username TEXT PRIMARY KEY, posts TEXT NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS events ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT NOT NULL, "
+            "origin TEXT NOT NULL, frame TEXT, created REAL NOT NULL)"
+        )
+        row = self._db.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()
+        self._last_event_id = row[0]
+        self._tailer = asyncio.create_task(self._tail())
+
+    async def stop(self) -> None:
+        if self._tailer is not None:
+            self._tailer.cancel()
+            self._tailer = None
+        await super().stop()
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    async def get(self, username: str) -> Optional[Homepage]:
+        row = self._db.execute(
+            "SELECT posts FROM sessions WHERE username = ?", (username,)
+        ).fetchone()
+        if row is None:
+            # Logged out (or never logged in) on another worker
+            self._drop_local(username)
+            return None
+
+        homepage = self._sessions.get(username)
+        if homepage is None:
+            homepage = await self._materialize(username)
+        homepage._posts = PostStore.from_state(json.loads(row[0]))
+        self._loaded_ids[username] = {post_id for post_id, _ in homepage._posts}
+        if homepage._reactive is not None:
+            # Another worker may have sent newer fragments than ours
+            homepage._reactive.forget()
+        return homepage
+
+    async def create(self, username: str) -> Homepage:
+        self._db.execute(
+            "INSERT OR IGNORE INTO sessions (username, posts) VALUES (?, ?)",
+            (username, json.dumps(PostStore().to_state())),
+        )
+        return await self.get(username)
+
+    async def remove(self, username: str) -> Optional[Homepage]:
+        self._db.execute("DELETE FROM sessions WHERE username = ?", (username,))
+        # A NULL frame tells the other workers to close their streams
+        self._append_event(username, None)
+        return self._drop_local(username)
+
+    async def save(self, homepage: Homepage) -> None:
+        username = homepage.username
+        local = homepage.posts
+        loaded = self._loaded_ids.get(username)
+        if loaded is None:
+            loaded = {post_id for post_id, _ in local}
+
+        # IMMEDIATE takes the write lock up front, so no other worker can save
+        # between our read and our write
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._db.execute(
+                "SELECT posts FROM sessions WHERE username = ?", (username,)
+            ).fetchone()
+            if row is None:
+                self._db.execute("ROLLBACK")
+                return
+            stored = PostStore.from_state(json.loads(row[0]))
+            for post_id in loaded:
+                if post_id not in local:
+                    stored.remove(post_id)
+            for post_id, content in local:
+                if post_id not in loaded:
+                    stored.add(content)
+            self._db.execute(
+                "UPDATE sessions SET posts = ? WHERE username = ?",
+                (json.dumps(stored.to_state()), username),
+            )
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+
+        # Carry on from the merged posts, with their stored ids
+        homepage._posts = stored
+        self._loaded_ids[username] = {post_id for post_id, _ in stored}
+
+    async def publish(self, username: str, frame: dict) -> None:
+        self._append_event(username, json.dumps(frame))
+        homepage = self._sessions.get(username)
+        if homepage is not None:
+            await homepage._enqueue(frame)
+
+    def _drop_local(self, username: str) -> Optional[Homepage]:
+        self._loaded_ids.pop(username, None)
+        return super()._drop_local(username)
+
+    def _append_event(self, username: str, frame: Optional[str]) -> None:
+        self._db.execute(
+            "INSERT INTO events (username, origin, frame, created) VALUES (?, ?, ?, ?)",
+            (username, self._origin, frame, time.time()),
+        )
+
+    async def _tail(self) -> None:
+        last_prune = time.monotonic()
+        while True:
+            await asyncio.sleep(self._poll_interval)
+            rows = self._db.execute(
+                "SELECT id, username, origin, frame FROM events WHERE id > ? ORDER BY id",
+                (self._last_event_id,),
+            ).fetchall()
+            for event_id, username, origin, frame in rows:
+                self._last_event_id = event_id
+                if origin == self._origin:
+                    continue
+                if frame is None:
+                    self._drop_local(username)
+                    continue
+                homepage = self._sessions.get(username)
+                if homepage is not None:
+                    await homepage._enqueue(json.loads(frame))
+
+            if time.monotonic() - last_prune > self._event_retention:
+                last_prune = time.monotonic()
+                self._db.execute(
+                    "DELETE FROM events WHERE created < ?",
+                    (time.time() - self._event_retention,),
+                )
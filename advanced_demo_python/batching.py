@@ -0,0 +1,84 @@
+from typing import Awaitable, Callable, Optional
+import asyncio
+from metrics import QUEUED_AT
+
+
+def merge_update(frame: dict, update: dict) -> dict:
+    """Merge an SSEXI update into a pending frame.
+
+    A later write to the same element id or JS variable wins, while every
+    ``exec`` is kept and appended in the order it was queued. The frame
+    keeps the queue time of its oldest update.
+    """
+    if QUEUED_AT in update:
+        frame.setdefault(QUEUED_AT, update[QUEUED_AT])
+
+    for element_id, html_content in update.get("html", {}).items():
+        html_updates = frame.setdefault("html", {})
+        html_updates.pop(element_id, None)
+        html_updates[element_id] = html_content
+
+    for key, value in update.get("js", {}).items():
+        js_updates = frame.setdefault("js", {})
+        if key == "exec":
+            execs = js_updates.setdefault("exec", [])
+            execs.extend(value if isinstance(value, list) else [value])
+        else:
+            js_updates.pop(key, None)
+            js_updates[key] = value
+
+    return frame
+
+
+class UpdateBatcher:
+    """Coalesce updates queued within a flush window into a single frame.
+
+    The first update of a batch starts the window timer; the batch is handed
+    to ``sink`` when the window elapses or ``max_updates`` have been merged,
+    whichever comes first.
+    """
+
+    def __init__(
+        self,
+        sink: Callable[[dict], Awaitable[None]],
+        window: float = 0.01,
+        max_updates: int = 32,
+    ):
+        self._sink = sink
+        self._window = window
+        self._max_updates = max_updates
+        self._pending: Optional[dict] = None
+        self._pending_count = 0
+        self._timer: Optional[asyncio.Task] = None
+
+    @property
+    def pending_count(self) -> int:
+        """Number of updates merged into the frame not yet flushed"""
+        return self._pending_count
+
+    async def add(self, update: dict) -> None:
+        """Merge an update into the pending frame, flushing if it is full"""
+        if self._pending is None:
+            self._pending = {}
+        merge_update(self._pending, update)
+        self._pending_count += 1
+
+        if self._pending_count >= self._max_updates:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def flush(self) -> None:
+        """Send the pending frame to the sink right away"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        frame, self._pending, self._pending_count = self._pending, None, 0
+        if frame:
+            await self._sink(frame)
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self._window)
+        self._timer = None
+        await self.flush()
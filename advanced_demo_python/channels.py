@@ -0,0 +1,205 @@
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+import asyncio
+import json
+import re
+import secrets
+from hub import encode_frame
+
+# Channel names become SSE event names; "message" and "sx-mux" are taken
+CHANNEL_NAME = re.compile(r"[A-Za-z0-9_.:-]{1,64}")
+RESERVED_CHANNELS = ("message", "sx-mux")
+
+# A subscription is an async iterator of encoded SSE messages with a close()
+# method, like hub.Subscriber. Openers get (channel, connection, last_event_id)
+# and return None when the connection's owner may not subscribe; a
+# last_event_id means the client is reconnecting and should be caught up
+# from there.
+ChannelOpener = Callable[[str, "MuxConnection", Optional[str]], Awaitable[Optional[AsyncIterator[bytes]]]]
+
+
+class BroadcastChannel:
+    """Channel shared by every subscriber, each frame encoded once.
+
+    A subscriber that falls more than ``buffer`` frames behind loses the
+    oldest ones, so a slow connection never holds up the others.
+    """
+
+    def __init__(self, buffer: int = 8):
+        self._buffer = buffer
+        self._queues: Set[asyncio.Queue] = set()
+        self._frame_size: Optional[int] = None
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._queues)
+
+    @property
+    def frame_size(self) -> Optional[int]:
+        """Size of the last encoded frame, None before the first"""
+        return self._frame_size
+
+    def publish(self, frame: dict) -> None:
+        data = encode_frame(frame)
+        self._frame_size = len(data)
+        for queue in self._queues:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(data)
+
+    def subscribe(self) -> "BroadcastSubscription":
+        queue = asyncio.Queue(self._buffer)
+        self._queues.add(queue)
+        return BroadcastSubscription(self, queue)
+
+    def _unsubscribe(self, queue: asyncio.Queue) -> None:
+        self._queues.discard(queue)
+
+
+class BroadcastSubscription:
+    def __init__(self, channel: BroadcastChannel, queue: asyncio.Queue):
+        self._channel = channel
+        self._queue = queue
+
+    @property
+    def frame_size(self) -> Optional[int]:
+        return self._channel.frame_size
+
+    def close(self) -> None:
+        self._channel._unsubscribe(self._queue)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> bytes:
+        return await self._queue.get()
+
+
+class MuxConnection:
+    """One SSE stream carrying any number of named channels.
+
+    Each channel's encoded messages are forwarded unchanged apart from an
+    ``event: <channel>`` line, which ssexi.js uses to route them. The first
+    message is an ``sx-mux`` event naming the connection, so the client can
+    subscribe and unsubscribe channels while it stays open. When a channel's
+    source ends (e.g. its session was closed) the whole stream ends and the
+    client reconnects.
+    """
+
+    def __init__(
+        self,
+        mux: "ChannelMux",
+        connection_id: str,
+        owner: str,
+        max_channels: int,
+        buffer: int,
+        templates: Optional[str] = None,
+    ):
+        self._mux = mux
+        self.id = connection_id
+        self.owner = owner
+        # Version of the fragment templates the client holds, see hub.SessionHub
+        self.templates = templates
+        self._max_channels = max_channels
+        self._channels: Dict[str, asyncio.Task] = {}
+        self._subscriptions: Dict[str, AsyncIterator[bytes]] = {}
+        self._out: asyncio.Queue = asyncio.Queue(buffer)
+        self._out.put_nowait(f"event: sx-mux\ndata: {json.dumps({'id': connection_id})}\n\n".encode())
+
+    @property
+    def channels(self) -> List[str]:
+        return list(self._channels)
+
+    @property
+    def frame_size(self) -> Optional[int]:
+        """Typical frame size of the channel with the largest frames, None if unknown"""
+        sizes = [getattr(subscription, "frame_size", None) for subscription in self._subscriptions.values()]
+        sizes = [size for size in sizes if size is not None]
+        return max(sizes) if sizes else None
+
+    async def subscribe(self, channel: str, last_event_id: Optional[str] = None) -> bool:
+        """Start forwarding ``channel``, returns False if it can't be joined"""
+        if channel in self._channels:
+            return True
+        if len(self._channels) >= self._max_channels:
+            return False
+        subscription = await self._mux.open(channel, self, last_event_id)
+        if subscription is None:
+            return False
+        self._subscriptions[channel] = subscription
+        self._channels[channel] = asyncio.create_task(self._pump(channel, subscription))
+        return True
+
+    def unsubscribe(self, channel: str) -> None:
+        self._subscriptions.pop(channel, None)
+        task = self._channels.pop(channel, None)
+        if task is not None:
+            task.cancel()
+
+    def close(self) -> None:
+        for task in self._channels.values():
+            task.cancel()
+        self._channels.clear()
+        self._subscriptions.clear()
+        self._mux._disconnect(self)
+
+    async def _pump(self, channel: str, subscription: AsyncIterator[bytes]) -> None:
+        prefix = f"event: {channel}\n".encode()
+        try:
+            async for data in subscription:
+                await self._out.put(prefix + data)
+            await self._out.put(None)
+        finally:
+            subscription.close()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> bytes:
+        data = await self._out.get()
+        if data is None:
+            raise StopAsyncIteration
+        return data
+
+
+class ChannelMux:
+    """Registry of channel openers and of the open multiplexed connections."""
+
+    def __init__(self, max_channels: int = 32, buffer: int = 64):
+        self._max_channels = max_channels
+        self._buffer = buffer
+        self._openers: List[Tuple[str, ChannelOpener]] = []
+        self._connections: Dict[str, MuxConnection] = {}
+
+    @property
+    def connection_count(self) -> int:
+        return len(self._connections)
+
+    def register(self, name: str, opener: ChannelOpener) -> None:
+        """Serve the channel ``name``, or every channel starting with it when
+        it ends with ``:`` (e.g. ``user:``)"""
+        self._openers.append((name, opener))
+
+    async def open(self, channel: str, connection: MuxConnection, last_event_id: Optional[str]):
+        if not CHANNEL_NAME.fullmatch(channel) or channel in RESERVED_CHANNELS:
+            return None
+        for name, opener in self._openers:
+            if channel == name or (name.endswith(":") and channel.startswith(name)):
+                return await opener(channel, connection, last_event_id)
+        return None
+
+    def connect(self, owner: str, templates: Optional[str] = None) -> MuxConnection:
+        connection = MuxConnection(
+            self, secrets.token_urlsafe(16), owner, self._max_channels, self._buffer, templates
+        )
+        self._connections[connection.id] = connection
+        return connection
+
+    def get(self, connection_id: str, owner: str) -> Optional[MuxConnection]:
+        """Look up an open connection, only for the owner that opened it"""
+        connection = self._connections.get(connection_id)
+        if connection is None or connection.owner != owner:
+            return None
+        return connection
+
+    def _disconnect(self, connection: MuxConnection) -> None:
+        self._connections.pop(connection.id, None)
@@ -0,0 +1,232 @@
+from html.parser import HTMLParser
+from typing import Dict, Iterable, List, Optional, Tuple
+import json
+
+# Elements that never have a closing tag
+VOID_ELEMENTS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input",
+    "link", "meta", "source", "track", "wbr",
+}
+
+
+class _FragmentSplitter(HTMLParser):
+    """Split a single-root fragment into its opening tag and child elements."""
+
+    def __init__(self, html: str):
+        super().__init__(convert_charrefs=False)
+        self._html = html
+        self._line_offsets = [0]
+        # HTMLParser counts lines by "\n" only, unlike str.splitlines()
+        for line in html.split("\n")[:-1]:
+            self._line_offsets.append(self._line_offsets[-1] + len(line) + 1)
+        self.open_tag: Optional[str] = None
+        self.children: List[str] = []
+        self.valid = True
+        self._depth = 0
+        self._closed = False
+        self._child_start = 0
+
+    def _offset(self) -> int:
+        line, col = self.getpos()
+        return self._line_offsets[line - 1] + col
+
+    def _start(self, tag: str, void: bool) -> None:
+        if self._closed:
+            self.valid = False
+        elif self._depth == 0:
+            if self.open_tag is not None or void:
+                self.valid = False
+            self.open_tag = self.get_starttag_text()
+            self._depth = 1
+        elif self._depth == 1:
+            start = self._offset()
+            if void:
+                self.children.append(self._html[start:start + len(self.get_starttag_text())])
+            else:
+                self._child_start = start
+                self._depth = 2
+        elif not void:
+            self._depth += 1
+
+    def handle_starttag(self, tag, attrs):
+        self._start(tag, tag in VOID_ELEMENTS)
+
+    def handle_startendtag(self, tag, attrs):
+        self._start(tag, True)
+
+    def handle_endtag(self, tag):
+        if tag in VOID_ELEMENTS:
+            return
+        if self._depth == 2:
+            end = self._html.index(">", self._offset()) + 1
+            self.children.append(self._html[self._child_start:end])
+        elif self._depth == 1:
+            self._closed = True
+        elif self._depth == 0:
+            self.valid = False
+        self._depth -= 1
+
+    def handle_data(self, data):
+        # Patches address element children only, so text beside them can't be kept
+        if data.strip() and self._depth < 2:
+            self.valid = False
+
+    def handle_comment(self, data):
+        if self._depth <= 1:
+            self.valid = False
+
+
+def split_fragment(html: str) -> Optional[Tuple[str, List[str]]]:
+    """Get the opening tag and child element markup of a fragment.
+
+    Returns None when the fragment isn't a single root element whose
+    children are elements separated by whitespace.
+    """
+    splitter = _FragmentSplitter(html)
+    try:
+        splitter.feed(html)
+        splitter.close()
+    except (ValueError, IndexError):
+        return None
+    if not splitter.valid or not splitter._closed or splitter.open_tag is None:
+        return None
+    return splitter.open_tag, splitter.children
+
+
+def split_fragments(html_updates: Dict[str, str]) -> Dict[str, Optional[Tuple[str, List[str]]]]:
+    """Split every fragment of a frame's HTML updates, see split_fragment"""
+    return {element_id: split_fragment(html) for element_id, html in html_updates.items()}
+
+
+def diff_children(old: List[str], new: List[str]) -> List[list]:
+    """Compute child-level ops turning ``old`` into ``new``.
+
+    Ops are applied in order to the target's element children:
+    ``["append", html]``, ``["insert", index, html]``,
+    ``["remove", index, count]`` and ``["replace", index, html]``.
+    Children that only moved because others were added or removed before
+    them (e.g. a list whose window slid by one item) are kept in place.
+    """
+    prefix = 0
+    limit = min(len(old), len(new))
+    while prefix < limit and old[prefix] == new[prefix]:
+        prefix += 1
+
+    suffix = 0
+    limit -= prefix
+    while suffix < limit and old[len(old) - 1 - suffix] == new[len(new) - 1 - suffix]:
+        suffix += 1
+
+    old_mid = old[prefix:len(old) - suffix]
+    new_mid = new[prefix:len(new) - suffix]
+
+    ops = []
+    index = prefix
+    i = j = 0
+    while i < len(old_mid) and j < len(new_mid):
+        if old_mid[i] == new_mid[j]:
+            index += 1
+            i += 1
+            j += 1
+            continue
+        # The nearest realignment: children removed here, or inserted here
+        removed = _find(old_mid, new_mid[j], i)
+        inserted = _find(new_mid, old_mid[i], j)
+        if removed is None and inserted is None:
+            ops.append(["replace", index, new_mid[j]])
+            index += 1
+            i += 1
+            j += 1
+        elif inserted is None or (removed is not None and removed - i <= inserted - j):
+            ops.append(["remove", index, removed - i])
+            i = removed
+        else:
+            ops.append(["insert", index, "".join(new_mid[j:inserted])])
+            index += inserted - j
+            j = inserted
+
+    if i < len(old_mid):
+        ops.append(["remove", index, len(old_mid) - i])
+    elif j < len(new_mid):
+        inserted = "".join(new_mid[j:])
+        if suffix == 0:
+            ops.append(["append", inserted])
+        else:
+            ops.append(["insert", index, inserted])
+    return ops
+
+
+def _find(children: List[str], child: str, start: int) -> Optional[int]:
+    try:
+        return children.index(child, start)
+    except ValueError:
+        return None
+
+
+def _patch_size(ops: List[list]) -> int:
+    # Sizes as they go on the wire, where JSON escaping can double markup
+    return len(json.dumps(ops))
+
+
+class DiffEngine:
+    """Turn full HTML updates into child-level patches.
+
+    Remembers the last HTML sent for each element id and replaces a new
+    fragment with a ``patch`` entry when its ops are smaller than the
+    fragment itself. Fragments whose root element changed, or that can't be
+    split into child elements, are sent whole.
+    """
+
+    def __init__(self):
+        self._last: Dict[str, Tuple[str, List[str]]] = {}
+
+    def reset(self) -> None:
+        """Forget what was sent so the next update of every id is sent whole"""
+        self._last.clear()
+
+    def forget(self, element_ids: Iterable[str]) -> None:
+        """Forget what was sent for ``element_ids`` so their next update is sent whole"""
+        for element_id in element_ids:
+            self._last.pop(element_id, None)
+
+    def diff(self, frame: dict, parts: Optional[Dict[str, Optional[Tuple[str, List[str]]]]] = None) -> dict:
+        """Get a copy of ``frame`` with HTML updates replaced by patches where smaller.
+
+        ``parts`` may give the frame's fragments already split, e.g. by
+        ``split_fragments`` on a worker; splitting is most of the cost.
+        """
+        html_updates = frame.get("html")
+        if not html_updates:
+            return frame
+        if parts is None:
+            parts = split_fragments(html_updates)
+
+        full = {}
+        patches = {}
+        for element_id, html_content in html_updates.items():
+            split = parts[element_id]
+            previous = self._last.get(element_id)
+            if split is None:
+                self._last.pop(element_id, None)
+                full[element_id] = html_content
+                continue
+
+            self._last[element_id] = split
+            if previous is None or previous[0] != split[0]:
+                full[element_id] = html_content
+                continue
+
+            ops = diff_children(previous[1], split[1])
+            if not ops:
+                continue
+            if _patch_size(ops) < len(json.dumps(html_content)):
+                patches[element_id] = ops
+            else:
+                full[element_id] = html_content
+
+        diffed = {key: value for key, value in frame.items() if key != "html"}
+        if full:
+            diffed["html"] = full
+        if patches:
+            diffed["patch"] = patches
+        return diffed
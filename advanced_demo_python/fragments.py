@@ -0,0 +1,132 @@
+from collections import OrderedDict
+from typing import Callable, Hashable, List, Optional, Tuple
+import threading
+from templating import TemplateRegistry, fill_template
+
+POSTS_LIST_STYLE = "background: #f8f9fa; padding: 1.5rem; border-radius: 4px; min-height: 200px;"
+EMPTY_POSTS_ITEM = '<li style="color: #666; font-style: italic;">No posts yet. Add some above! 👆</li>'
+
+POST_ITEM_TEMPLATE = '''
+                <li class="post" style="padding: 0.5rem 0; border-bottom: 1px solid #eee; display: flex; justify-content: space-between; align-items: center;">
+                    <span class="post-number">{{post}}</span>
+                    <form sx-post="/delete_post" sx-swap="none" style="margin: 0;">
+                        <input type="hidden" name="post_id" value="{{post_id}}">
+                        <button type="submit" id="delete_btn_{{post_id}}"
+                                style="background: #dc3545; color: white; border: none; padding: 0.25rem 0.5rem; border-radius: 3px; cursor: pointer; font-size: 0.8rem;">
+                            🗑️ Delete
+                        </button>
+                    </form>
+                </li>
+            '''
+
+
+class FragmentCache:
+    """LRU cache of rendered HTML fragments bounded by a memory budget.
+
+    The budget is counted in characters of cached markup; least recently
+    used fragments are evicted once it is exceeded. Safe to share with
+    render pool threads; rendering itself happens outside the lock.
+    """
+
+    def __init__(self, budget: int = 4_000_000):
+        self._budget = budget
+        self._size = 0
+        self._entries: "OrderedDict[Hashable, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def size(self) -> int:
+        """Characters of markup currently cached"""
+        return self._size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_or_render(self, key: Hashable, render: Callable[[], str]) -> str:
+        """Get the fragment cached under ``key``, rendering and caching it on a miss"""
+        with self._lock:
+            fragment = self._entries.get(key)
+            if fragment is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return fragment
+            self.misses += 1
+
+        fragment = render()
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[key] = fragment
+            self._size += len(fragment)
+            while self._size > self._budget and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+        return fragment
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+
+def render_post_item(post_id: int, post: str) -> str:
+    """Render a single post with its delete button"""
+    return fill_template(POST_ITEM_TEMPLATE, {"post_id": post_id, "post": post})
+
+
+def render_show_more_item(hidden: int) -> str:
+    """Render the button revealing older posts above the visible window"""
+    # Restarting the counter here keeps the visible posts' numbers right
+    return f'''
+                <li style="counter-reset: post {hidden}; list-style: none; padding: 0.5rem 0; border-bottom: 1px solid #eee;">
+                    <form sx-post="/show_more_posts" sx-swap="none" style="margin: 0;">
+                        <button type="submit"
+                                style="background: none; color: #007bff; border: 1px solid #007bff; padding: 0.25rem 0.5rem; border-radius: 3px; cursor: pointer; font-size: 0.8rem;">
+                            ⬆️ Show earlier posts ({hidden} hidden)
+                        </button>
+                    </form>
+                </li>
+            '''
+
+
+class PostListRenderer:
+    """Render a user's ``ol_{username}`` posts list from cached items.
+
+    Items are cached by (post id, content) and don't embed their position,
+    so rebuilding the list only formats posts that are new and joins cached
+    markup for the rest. Posts outside the window are left out, under a
+    button that widens it. Given a ``templates`` registry,
+    items are rendered through its ``post_item`` template so frames can
+    carry them as template references.
+    """
+
+    def __init__(self, cache: FragmentCache, templates: Optional[TemplateRegistry] = None):
+        self._cache = cache
+        self._templates = templates
+        if templates is not None:
+            templates.register("post_item", POST_ITEM_TEMPLATE)
+
+    def render_window(self, username: str, visible: List[Tuple[int, str]], hidden: int) -> str:
+        """Render the list for posts taken by ``Homepage.post_window``; safe off the event loop"""
+        if visible:
+            items = "".join(
+                self._cache.get_or_render(
+                    (post_id, post), lambda post_id=post_id, post=post: self._render_item(post_id, post)
+                )
+                for post_id, post in visible
+            )
+        else:
+            items = EMPTY_POSTS_ITEM
+
+        if hidden:
+            items = render_show_more_item(hidden) + items
+        return f'<ol id="ol_{username}" class="posts" style="{POSTS_LIST_STYLE}">{items}</ol>'
+
+    def _render_item(self, post_id: int, post: str) -> str:
+        if self._templates is None:
+            return render_post_item(post_id, post)
+        return self._templates.expand("post_item", post_id=post_id, post=post)
@@ -0,0 +1,370 @@
+from typing import List, Optional, Set, Tuple
+import asyncio
+import json
+import uuid
+from diffing import DiffEngine, split_fragments
+from rendering import RenderPool
+from snapshots import SnapshotStore
+from templating import TemplateRegistry
+import metrics
+
+
+def encode_frame(frame: dict, event_id: Optional[str] = None) -> bytes:
+    """Encode an SSEXI frame as an SSE ``data:`` message"""
+    if event_id is None:
+        return f"data: {json.dumps(frame)}\n\n".encode()
+    return f"id: {event_id}\ndata: {json.dumps(frame)}\n\n".encode()
+
+
+def encode_frames(frame: dict, compacted: Optional[dict], event_id: str) -> Tuple[bytes, Optional[bytes]]:
+    """Encode a frame and, when there is one, its template-compacted form"""
+    data = encode_frame(frame, event_id)
+    return data, None if compacted is None else encode_frame(compacted, event_id)
+
+
+class Subscriber:
+    """Cursor of a single SSE connection over a hub's ring buffer."""
+
+    def __init__(self, hub: "SessionHub", cursor: int, needs_snapshot: bool = False, templates: bool = False):
+        self._hub = hub
+        self._cursor = cursor
+        self._needs_snapshot = needs_snapshot
+        self._skipped = 0
+        # Whether this connection reads frames with template references
+        self.templates = templates
+        # Template definitions to send before anything else
+        self._definitions: Optional[bytes] = None
+
+    @property
+    def skipped(self) -> int:
+        """Number of frames overwritten before this subscriber read them"""
+        return self._skipped
+
+    @property
+    def frame_size(self) -> Optional[int]:
+        """Typical size of the session's encoded frames, None before the first"""
+        return self._hub.average_frame_size
+
+    @property
+    def lag(self) -> int:
+        """Number of published frames not yet read"""
+        return self._hub.next_seq - self._cursor
+
+    async def get(self) -> Optional[bytes]:
+        """Wait for the next encoded frame, returns None once the hub closes"""
+        hub = self._hub
+        if self._definitions is not None:
+            data, self._definitions = self._definitions, None
+            return data
+
+        if self._needs_snapshot:
+            self._needs_snapshot = False
+            self._cursor = hub.next_seq
+            snapshot = hub.snapshot(self.templates)
+            if snapshot is not None:
+                return snapshot
+
+        while True:
+            while self._cursor >= hub.next_seq:
+                if hub.closed:
+                    return None
+                await hub.wait()
+            if self._cursor >= hub.oldest_seq:
+                break
+            # Frames we missed have left the replay log; catch up in one
+            # frame, or skip them and keep waiting when there's no state yet
+            self._skipped += hub.next_seq - self._cursor
+            self._cursor = hub.next_seq
+            snapshot = hub.snapshot(self.templates)
+            if snapshot is not None:
+                return snapshot
+
+        data = hub.frame_at(self._cursor, self.templates)
+        if metrics.enabled:
+            metrics.observe_delivery(hub.queued_at(self._cursor))
+        self._cursor += 1
+        return data
+
+    def close(self) -> None:
+        self._hub.unsubscribe(self)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> bytes:
+        data = await self.get()
+        if data is None:
+            raise StopAsyncIteration
+        return data
+
+
+class SessionHub:
+    """Per-session pub/sub hub delivering each frame to every connection.
+
+    Frames are drained from the session queue, encoded once and stored in a
+    fixed-size ring buffer; every subscriber reads the same bytes through its
+    own cursor. The queue is only drained while at least one subscriber is
+    attached. With no one attached, frames are ``absorb``-ed instead: folded
+    into ``snapshots`` so pages built from them stay current, but neither
+    encoded nor kept for replay.
+
+    Each frame carries an ``<epoch>:<seq>`` event id, which makes the ring
+    buffer a replay log: a stream resumes right after its ``Last-Event-ID``
+    (pages built from ``snapshots`` carry the id they were built at).
+    Any other stream starts with a single state frame from ``snapshots``,
+    the latest HTML and JS variables as of the last published frame.
+
+    With a ``differ``, HTML updates are published as patches against the
+    HTML the hub sent last. All subscribers share the encoded frames, so the
+    diff base is per session stream rather than per connection; it always
+    matches the snapshot, so every stream can apply the patches that follow.
+
+    With a ``templates`` registry, subscribers that hold its definitions read
+    a second encoding of each frame in which rendered markup is replaced by
+    template references. It is made once per frame, and only while such a
+    subscriber is attached; everyone else reads the full HTML.
+
+    With a ``render_pool``, large frames are split for diffing and encoded on
+    the pool so they don't stall every other stream on the event loop. The
+    pump awaits each frame before taking the next, which keeps the session's
+    frames in order.
+    """
+
+    def __init__(
+        self,
+        source: asyncio.Queue,
+        capacity: int = 256,
+        differ: Optional[DiffEngine] = None,
+        templates: Optional[TemplateRegistry] = None,
+        render_pool: Optional[RenderPool] = None,
+    ):
+        self._source = source
+        self._differ = differ
+        self._templates = templates
+        self._render_pool = render_pool
+        self._publishing = False
+        self._ring: List[Optional[bytes]] = [None] * capacity
+        self._compact: List[Optional[bytes]] = [None] * capacity
+        # When each ring slot's frame was first queued, for delivery latency
+        self._queued_at: List[Optional[float]] = [None] * capacity
+        self._epoch = uuid.uuid4().hex[:8]
+        self._next_seq = 0
+        # Absorbed frames can't be replayed, so neither can anything before them
+        self._replay_from = 0
+        self._snapshots = SnapshotStore()
+        self._frame_size: Optional[float] = None
+        self._subscribers: Set[Subscriber] = set()
+        self._pump: Optional[asyncio.Task] = None
+        self._waiter: Optional[asyncio.Future] = None
+        self._closed = False
+
+    @property
+    def next_seq(self) -> int:
+        return self._next_seq
+
+    @property
+    def snapshots(self) -> SnapshotStore:
+        return self._snapshots
+
+    @property
+    def last_event_id(self) -> Optional[str]:
+        """Event id of the last published frame, which the snapshots include"""
+        return self.event_id(self._next_seq - 1) if self._next_seq else None
+
+    @property
+    def oldest_seq(self) -> int:
+        return max(self._replay_from, self._next_seq - len(self._ring))
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    @property
+    def average_frame_size(self) -> Optional[int]:
+        """Moving average of encoded frame sizes, None before the first frame"""
+        return None if self._frame_size is None else int(self._frame_size)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    @property
+    def idle(self) -> bool:
+        """No subscribers and no pump, so frames should be absorbed"""
+        return not self._subscribers and self._pump is None
+
+    def frame_at(self, seq: int, templates: bool = False) -> bytes:
+        slot = seq % len(self._ring)
+        if templates and self._compact[slot] is not None:
+            return self._compact[slot]
+        return self._ring[slot]
+
+    def queued_at(self, seq: int) -> Optional[float]:
+        return self._queued_at[seq % len(self._queued_at)]
+
+    def event_id(self, seq: int) -> str:
+        return f"{self._epoch}:{seq}"
+
+    def resume_cursor(self, last_event_id: str) -> Optional[int]:
+        """Get the cursor following ``last_event_id``, None if it can't be replayed"""
+        epoch, _, seq = last_event_id.rpartition(":")
+        if epoch != self._epoch:
+            return None
+        try:
+            cursor = int(seq) + 1
+        except ValueError:
+            return None
+        if self.oldest_seq <= cursor <= self._next_seq:
+            return cursor
+        return None
+
+    def snapshot(self, templates: bool = False) -> Optional[bytes]:
+        """Encode the latest HTML and JS variables as a single frame"""
+        if not self._snapshots:
+            return None
+        compact = templates and self._templates is not None
+        return self._snapshots.encoded(compact, lambda frame: encode_frame(
+            self._templates.compact(frame) if compact else frame, self.last_event_id
+        ))
+
+    def subscribe(self, last_event_id: Optional[str] = None, templates: Optional[str] = None) -> Subscriber:
+        """Attach a new subscriber.
+
+        It resumes after ``last_event_id`` when the replay log still has it,
+        and otherwise starts with a snapshot of the current state.
+        ``templates`` is the version of the template definitions the client
+        holds (any other value if it has none but can expand them); None
+        means it only understands full HTML.
+        """
+        cursor = None
+        use_templates = templates is not None and self._templates is not None
+        if last_event_id:
+            cursor = self.resume_cursor(last_event_id)
+        if cursor is None:
+            subscriber = Subscriber(self, self._next_seq, True, use_templates)
+        else:
+            subscriber = Subscriber(self, cursor, templates=use_templates)
+        if use_templates and templates != self._templates.version:
+            subscriber._definitions = encode_frame({"templates": self._templates.definitions()})
+        self._subscribers.add(subscriber)
+        if self._pump is None and not self._closed:
+            self._pump = asyncio.create_task(self._run_pump())
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        self._subscribers.discard(subscriber)
+        # A pump in the middle of a frame stops once it is published
+        if not self._subscribers and self._pump is not None and not self._publishing:
+            self._pump.cancel()
+            self._pump = None
+            self._absorb_queued()
+
+    def publish(self, frame: dict) -> None:
+        """Encode a frame once and make it available to all subscribers"""
+        queued_at = frame.pop(metrics.QUEUED_AT, None)
+        diffed = self._diff(frame)
+        if not diffed:
+            return
+        event_id = self.event_id(self._next_seq)
+        self._store(frame, *encode_frames(diffed, self._compacted(diffed), event_id), queued_at)
+
+    async def publish_offloaded(self, frame: dict) -> None:
+        """Publish a frame, splitting and encoding it on the render pool when large"""
+        pool = self._render_pool
+        size = sum(len(markup) for markup in frame.get("html", {}).values())
+        if not pool.offloads(size):
+            self.publish(frame)
+            return
+
+        queued_at = frame.pop(metrics.QUEUED_AT, None)
+        parts = None
+        if self._differ is not None:
+            parts = await pool.run(size, split_fragments, frame["html"])
+        diffed = self._diff(frame, parts)
+        if not diffed:
+            return
+        event_id = self.event_id(self._next_seq)
+        encoded = await pool.run(size, encode_frames, diffed, self._compacted(diffed), event_id)
+        self._store(frame, *encoded, queued_at)
+
+    def absorb(self, frame: dict) -> None:
+        """Fold a frame into the snapshots without publishing it, while idle"""
+        # Frames the pump left queued come before this one
+        self._absorb_queued()
+        self._fold(frame)
+
+    def _absorb_queued(self) -> None:
+        while not self._source.empty():
+            self._fold(self._source.get_nowait())
+
+    def _fold(self, frame: dict) -> None:
+        frame.pop(metrics.QUEUED_AT, None)
+        if self._differ is not None:
+            # Streams will start from the snapshot, which has these ids whole
+            self._differ.forget(frame.get("html", {}))
+        self._snapshots.update(frame)
+        self._next_seq += 1
+        self._replay_from = self._next_seq
+
+    def _diff(self, frame: dict, parts=None) -> dict:
+        if self._differ is None:
+            return frame
+        return self._differ.diff(frame, parts)
+
+    def _compacted(self, frame: dict) -> Optional[dict]:
+        """Get the frame with template references, None if no one reads it"""
+        if self._templates is None or not any(s.templates for s in self._subscribers):
+            return None
+        compacted = self._templates.compact(frame)
+        return None if compacted is frame else compacted
+
+    def _store(self, frame: dict, data: bytes, compact: Optional[bytes], queued_at: Optional[float]) -> None:
+        # Snapshots move with the sequence, so a snapshot and the frames
+        # after its event id never overlap
+        self._snapshots.update(frame)
+        slot = self._next_seq % len(self._ring)
+        self._ring[slot] = data
+        self._compact[slot] = compact
+        self._queued_at[slot] = queued_at
+        if self._frame_size is None:
+            self._frame_size = float(len(data))
+        else:
+            self._frame_size += (len(data) - self._frame_size) * 0.2
+        if metrics.enabled:
+            metrics.FRAME_BYTES.observe(len(data))
+        self._next_seq += 1
+        self._wake()
+
+    async def wait(self) -> None:
+        """Wait until a frame is published or the hub closes"""
+        if self._waiter is None:
+            self._waiter = asyncio.get_running_loop().create_future()
+        await asyncio.shield(self._waiter)
+
+    def close(self) -> None:
+        """Stop draining the queue and end every subscriber's stream"""
+        self._closed = True
+        if self._pump is not None:
+            self._pump.cancel()
+            self._pump = None
+        self._wake()
+
+    def _wake(self) -> None:
+        if self._waiter is not None:
+            if not self._waiter.done():
+                self._waiter.set_result(None)
+            self._waiter = None
+
+    async def _run_pump(self) -> None:
+        while self._subscribers:
+            frame = await self._source.get()
+            self._publishing = True
+            try:
+                if self._render_pool is None:
+                    self.publish(frame)
+                else:
+                    await self.publish_offloaded(frame)
+            finally:
+                self._publishing = False
+        self._pump = None
+        self._absorb_queued()
@@ -0,0 +1,82 @@
+from typing import Awaitable, Callable, Dict, Optional, Set
+import asyncio
+import itertools
+
+JobWork = Callable[[], Awaitable[None]]
+
+
+class Job:
+    """A unit of background work owned by one user's session."""
+
+    def __init__(self, job_id: int, username: str, name: str, task: asyncio.Task):
+        self.id = job_id
+        self.username = username
+        self.name = name
+        self.task = task
+
+    @property
+    def done(self) -> bool:
+        return self.task.done()
+
+
+class JobRunner:
+    """Run long handler work as managed tasks instead of inside the request.
+
+    Handlers ``submit`` the work and return right away; the job reports its
+    progress over the session's SSE stream. At most ``max_jobs`` run at once
+    and at most ``max_per_user`` per user, so repeated clicks can't start
+    parallel copies of the same work. Jobs are cancelled with ``cancel``
+    when their session goes away. The limits only count this process's
+    jobs; each worker of a multi-worker deployment has its own.
+    """
+
+    def __init__(self, max_jobs: int = 100, max_per_user: int = 1):
+        self._max_jobs = max_jobs
+        self._max_per_user = max_per_user
+        self._jobs: Dict[str, Set[Job]] = {}
+        self._ids = itertools.count(1)
+        self._active = 0
+        self.rejected = 0
+
+    @property
+    def active(self) -> int:
+        """Number of jobs currently running"""
+        return self._active
+
+    def running(self, username: str) -> int:
+        return len(self._jobs.get(username, ()))
+
+    def submit(self, username: str, name: str, work: JobWork) -> Optional[Job]:
+        """Start ``work`` for ``username``, returns None when a limit is reached"""
+        if self._active >= self._max_jobs or self.running(username) >= self._max_per_user:
+            self.rejected += 1
+            return None
+
+        job = Job(next(self._ids), username, name, asyncio.create_task(work()))
+        self._jobs.setdefault(username, set()).add(job)
+        self._active += 1
+        job.task.add_done_callback(lambda _: self._finished(job))
+        return job
+
+    def cancel(self, username: str) -> int:
+        """Cancel every job of ``username``, returns how many were running"""
+        jobs = self._jobs.get(username, ())
+        for job in jobs:
+            job.task.cancel()
+        return len(jobs)
+
+    async def stop(self) -> None:
+        """Cancel all jobs and wait for them to unwind"""
+        tasks = [job.task for jobs in self._jobs.values() for job in jobs]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _finished(self, job: Job) -> None:
+        jobs = self._jobs.get(job.username)
+        if jobs is None or job not in jobs:
+            return
+        jobs.discard(job)
+        if not jobs:
+            del self._jobs[job.username]
+        self._active -= 1
@@ -1,22 +1,41 @@
 from fastapi import FastAPI, Request, Form
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, StreamingResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, PlainTextResponse
 from fastapi.templating import Jinja2Templates
-from fastapi.staticfiles import StaticFiles
+from typing import Callable
 import base64
-import secrets
 import random
 import string
-import json
 import asyncio
-from typing import Dict
+import os
 from models import Homepage
+from batching import UpdateBatcher
+from queues import SessionQueue, LATEST_WINS
+from hub import SessionHub
+from diffing import DiffEngine
+from fragments import FragmentCache, PostListRenderer, POST_ITEM_TEMPLATE
+from templating import TemplateRegistry
+from backends import InProcessBackend, SQLiteBackend
+from sessions import SessionManager
+from persistence import WriteBehindStore
+from jobs import JobRunner
+from assets import StaticAssets
+from reactive import Binding, ReactiveState
+from rendering import RenderPool
+from channels import BroadcastChannel, ChannelMux
+from sse import EventStreamResponse, StreamLimiter, STREAM_ENCODINGS
+import metrics
 import uuid
+import time
 
 app = FastAPI()
 templates = Jinja2Templates(directory="templates")
 
-# Serve static files (for ssexi.js)
-app.mount("/static", StaticFiles(directory="."), name="static")
+# Static files (ssexi.js) are fingerprinted, precompressed and served from
+# memory with immutable caching; templates link them with asset_url(name)
+STATIC_ASSETS = ["ssexi.js"]
+MINIFY_ASSETS = True
+static_assets = StaticAssets(".", STATIC_ASSETS, "/static", MINIFY_ASSETS)
+templates.env.globals["asset_url"] = static_assets.url
 
 # Simulated user database
 USERS = {
@@ -24,23 +43,263 @@ USERS = {
     "luke": "pass456"
 }
 
-# Store active user sessions
-user_sessions: Dict[str, Homepage] = {}
+
+# Fragment templates: streams opened with ?templates=<version> get their
+# definitions once and then frames carrying {"tpl": name, "params": {...}}
+# instead of the rendered markup; other streams keep receiving full HTML
+TEMPLATE_FRAMES = True
+fragment_templates = TemplateRegistry()
+
+# Rendered post items shared by every session, bounded by FRAGMENT_CACHE_BUDGET characters
+FRAGMENT_CACHE_BUDGET = 4_000_000
+post_list_renderer = PostListRenderer(FragmentCache(FRAGMENT_CACHE_BUDGET), fragment_templates)
+
+# Rendering and frame encoding larger than RENDER_OFFLOAD_THRESHOLD characters
+# runs on a pool instead of the event loop: SSEXI_RENDER_POOL=thread (default)
+# or process, which only takes stateless work (splitting fragments for
+# diffing, JSON encoding) and leaves cached renders on the loop
+RENDER_POOL_KIND = os.environ.get("SSEXI_RENDER_POOL", "thread")
+RENDER_POOL_WORKERS = 4
+RENDER_OFFLOAD_THRESHOLD = 32_000
+render_pool = RenderPool(RENDER_POOL_KIND, RENDER_POOL_WORKERS, RENDER_OFFLOAD_THRESHOLD)
+
+# Only the newest POSTS_PAGE_SIZE posts are rendered; "show earlier posts"
+# widens the window by another page. New posts join the window instead of
+# sliding it, see Homepage.post_window
+POSTS_PAGE_SIZE = 50
+
+# Number of posts a generate_posts job adds
+GENERATE_POSTS_COUNT = 5
+
+async def render_posts_list(user: Homepage) -> dict:
+    """Posts list, rendered on the render pool when it is long"""
+    visible, hidden = user.post_window()
+    markup = await render_pool.run(
+        len(visible) * len(POST_ITEM_TEMPLATE),
+        post_list_renderer.render_window, user.username, visible, hidden,
+        stateful=True,
+    )
+    return {"html": {f"ol_{user.username}": markup}}
+
+def render_posts_chart(user: Homepage) -> dict:
+    """Update chart in real-time via SSEXI JS execution"""
+    chart_data = { 'x': user.post_count , 'y': user.post_count }
+    return {"js": {"exec": f'myChart.data.datasets[0].data = [{chart_data}]; myChart.update();'}}
+
+fragment_templates.register("posts_title", '''<h2 id="post_title_length_{{username}}"> 📋 Your Posts ({{count}} total)</h2>''')
+fragment_templates.register("generate_button", '''<button id="btn_{{username}}" type="submit"
+            style="width: 100%; background: #6c757d; color: white; border: 2px solid black; padding: 0.75rem; border-radius: 4px; cursor: pointer; font-size: 1rem;">
+            🎯 Generate {{total}} Posts
+            </button>
+        ''')
+fragment_templates.register("generate_button_busy", '''<button id="btn_{{username}}" type="submit"
+          style="width: 100%; border: none; padding: 0.75rem; border-radius: 4px; cursor: pointer; font-size: 1rem;"
+          disabled>
+          ⏳ Generating posts ({{done}}/{{total}})
+          </button>
+        ''')
+
+def render_generate_button(user: Homepage) -> dict:
+    """Generate button, disabled and showing progress while a job runs"""
+    if user.generate_progress is None:
+        return {"html": {f"btn_{user.username}": fragment_templates.expand(
+            "generate_button", username=user.username, total=GENERATE_POSTS_COUNT
+        )}}
+    return {"html": {f"btn_{user.username}": fragment_templates.expand(
+        "generate_button_busy", username=user.username, done=user.generate_progress, total=GENERATE_POSTS_COUNT
+    )}}
+
+# What a Homepage sends when its fields change: each binding re-renders only
+# when a field it depends on was marked, and only goes out if it changed
+HOMEPAGE_BINDINGS = [
+    Binding("posts_list", ("posts", "post_limit"), render_posts_list),
+    Binding("posts_title", ("post_count",), lambda user: {"html": {
+        f"post_title_length_{user.username}":
+            fragment_templates.expand("posts_title", username=user.username, count=user.post_count)
+    }}),
+    Binding("posts_chart", ("post_count",), render_posts_chart),
+    Binding("generate_button", ("generate_progress",), render_generate_button),
+]
+
+# Updates queued within this window (seconds) are sent as a single frame
+BATCH_WINDOW = 0.01
+BATCH_MAX_UPDATES = 32
+
+# Frames kept per session while no stream is reading them
+SESSION_QUEUE_SIZE = 64
+SESSION_QUEUE_POLICY = LATEST_WINS
+
+# Encoded frames kept for streams that fall behind or reconnect (replay log)
+HUB_CAPACITY = 256
+
+# Open SSE streams: heartbeat comment after STREAM_HEARTBEAT idle seconds,
+# client reconnect hint, and caps beyond which new streams get a 503
+STREAM_HEARTBEAT = 15.0
+STREAM_RETRY_MS = 5000
+MAX_STREAMS = 10_000
+MAX_STREAMS_PER_USER = 8
+stream_limiter = StreamLimiter(MAX_STREAMS, MAX_STREAMS_PER_USER)
+
+# Compress streams for clients that accept it (brotli when installed, else
+# gzip/deflate), unless the session's frames average under the minimum size
+STREAM_COMPRESSION = True
+STREAM_COMPRESS_MIN_SIZE = 256
+
+# Multiplexed streams (/mux): one SSE connection per tab carrying several
+# channels, e.g. "user:<name>" (the session's updates) and "ticker"
+MAX_MUX_CHANNELS = 32
+MUX_BUFFER = 64
+TICKER_INTERVAL = 1.0
+channel_mux = ChannelMux(MAX_MUX_CHANNELS, MUX_BUFFER)
+ticker_channel = BroadcastChannel()
+ticker_task = None
+
+# Send child-level patches instead of whole fragments when they are smaller
+HTML_DIFFING = True
 
 async def create_homepage(username: str) -> Homepage:
     """Create a new Homepage instance with initialized queue."""
     homepage = Homepage(username)
+    homepage.post_limit = POSTS_PAGE_SIZE
+    homepage._reactive = ReactiveState(HOMEPAGE_BINDINGS)
     # Initialize the queue in an async context
-    homepage._update_queue = asyncio.Queue()
+    homepage._update_queue = SessionQueue(SESSION_QUEUE_SIZE, SESSION_QUEUE_POLICY)
+    homepage._hub = SessionHub(
+        homepage._update_queue,
+        HUB_CAPACITY,
+        DiffEngine() if HTML_DIFFING else None,
+        fragment_templates if TEMPLATE_FRAMES else None,
+        render_pool,
+    )
+    homepage._batcher = UpdateBatcher(homepage._deliver, BATCH_WINDOW, BATCH_MAX_UPDATES)
     return homepage
 
-async def verify_credentials(username: str, password: str):
-    """Verify user credentials and create/return Homepage instance."""
-    if username in USERS and secrets.compare_digest(password, USERS[username]):
-        if username not in user_sessions:
-            user_sessions[username] = await create_homepage(username)
-        return user_sessions[username]
-    return None
+# Store active user sessions. Set SSEXI_SESSION_DB to a SQLite path to share
+# sessions and updates between workers (uvicorn main:app --workers N), or
+# SSEXI_SESSION_STORE to persist a single worker's sessions write-behind,
+# committing every SESSION_FLUSH_INTERVAL seconds or SESSION_FLUSH_MAX records
+SESSION_DB = os.environ.get("SSEXI_SESSION_DB")
+SESSION_STORE = os.environ.get("SSEXI_SESSION_STORE")
+SESSION_FLUSH_INTERVAL = 0.05
+SESSION_FLUSH_MAX = 256
+if SESSION_DB:
+    session_backend = SQLiteBackend(create_homepage, SESSION_DB)
+elif SESSION_STORE:
+    session_backend = InProcessBackend(
+        create_homepage, WriteBehindStore(SESSION_STORE, SESSION_FLUSH_INTERVAL, SESSION_FLUSH_MAX)
+    )
+else:
+    session_backend = InProcessBackend(create_homepage)
+
+# Sessions idle longer than the auth cookie are released; at most
+# MAX_SESSIONS stay in memory, least recently used evicted first
+SESSION_IDLE_TTL = 1800
+MAX_SESSIONS = 10_000
+SESSION_REAP_INTERVAL = 60
+session_manager = SessionManager(
+    session_backend, USERS, SESSION_IDLE_TTL, MAX_SESSIONS, SESSION_REAP_INTERVAL
+)
+
+# Long-running work (e.g. generate_posts) runs as background jobs reporting
+# over SSE; one job per user at a time, cancelled when the session goes away.
+# The limits are per worker process: with SSEXI_SESSION_DB and N workers a
+# user can run up to N jobs at once
+MAX_JOBS = 100
+MAX_JOBS_PER_USER = 1
+job_runner = JobRunner(MAX_JOBS, MAX_JOBS_PER_USER)
+session_manager.add_eviction_hook(lambda homepage, reason: job_runner.cancel(homepage.username))
+
+async def open_user_channel(channel: str, connection, last_event_id):
+    """A session's updates, for its own user only"""
+    username = channel.partition(":")[2]
+    if username != connection.owner:
+        return None
+    user = await session_manager.get(username)
+    if not user:
+        return None
+    return user.subscribe(last_event_id, connection.templates)
+
+async def open_ticker_channel(channel: str, connection, last_event_id):
+    return ticker_channel.subscribe()
+
+channel_mux.register("user:", open_user_channel)
+channel_mux.register("ticker", open_ticker_channel)
+
+async def run_ticker():
+    """Publish the server time to the ticker channel while anyone listens"""
+    while True:
+        await asyncio.sleep(TICKER_INTERVAL)
+        if ticker_channel.subscriber_count:
+            now = time.strftime("%H:%M:%S")
+            ticker_channel.publish({"html": {"server_time": f'<span id="server_time">{now}</span>'}})
+
+# Prometheus metrics at /metrics (set SSEXI_METRICS=0 to disable). Per-session
+# queue figures and stream counts are read when scraped, not on every update
+EVENT_LOOP_LAG_INTERVAL = 0.5
+loop_lag_monitor = None
+
+def queue_samples(field: str):
+    for username, homepage in session_backend.local_sessions.items():
+        if homepage._update_queue is not None:
+            yield {"username": username}, homepage._update_queue.stats()[field]
+
+if metrics.enabled:
+    app.add_middleware(metrics.RouteTimingMiddleware)
+    metrics.registry.register(metrics.Gauge(
+        "ssexi_session_queue_depth",
+        "Frames waiting in a session's queue",
+        lambda: queue_samples("depth"),
+    ))
+    metrics.registry.register(metrics.Counter(
+        "ssexi_session_queue_dropped_total",
+        "Frames a session's queue discarded because it was full",
+        lambda: queue_samples("dropped"),
+    ))
+    metrics.registry.register(metrics.Gauge(
+        "ssexi_active_streams",
+        "Open SSE streams",
+        lambda: [({}, stream_limiter.active)],
+    ))
+    metrics.registry.register(metrics.Counter(
+        "ssexi_rejected_streams_total",
+        "SSE streams refused because a cap was reached",
+        lambda: [({}, stream_limiter.rejected)],
+    ))
+    metrics.registry.register(metrics.Gauge(
+        "ssexi_mux_connections",
+        "Open multiplexed streams",
+        lambda: [({}, channel_mux.connection_count)],
+    ))
+    metrics.registry.register(metrics.Gauge(
+        "ssexi_render_pool_pending",
+        "Render pool tasks submitted and not finished",
+        lambda: [({"kind": render_pool.kind}, render_pool.pending)],
+    ))
+    metrics.registry.register(metrics.Gauge(
+        "ssexi_render_pool_saturation",
+        "Render pool tasks pending per worker, above 1 work is queueing",
+        lambda: [({"kind": render_pool.kind}, render_pool.saturation)],
+    ))
+    metrics.registry.register(metrics.Counter(
+        "ssexi_render_tasks_total",
+        "Renders and encodes by where they ran",
+        lambda: [({"where": "pool"}, render_pool.offloaded), ({"where": "inline"}, render_pool.inline)],
+    ))
+    metrics.registry.register(metrics.Gauge(
+        "ssexi_jobs_running",
+        "Background jobs currently running",
+        lambda: [({}, job_runner.active)],
+    ))
+    metrics.registry.register(metrics.Gauge(
+        "ssexi_sessions",
+        "Sessions held in this process",
+        lambda: [({}, len(session_backend.local_sessions))],
+    ))
+
+def page_fragment(user: Homepage, element_id: str, render: Callable[[], str]) -> str:
+    """The fragment last streamed for ``element_id``, rendered if there is none"""
+    cached = user.cached_fragment(element_id)
+    return cached if cached is not None else render()
 
 @app.get("/", response_class=HTMLResponse)
 async def home(request: Request):
@@ -50,14 +309,31 @@ async def home(request: Request):
 
     try:
         username = base64.b64decode(auth_token).decode().split(":")[0]
-        user = user_sessions.get(username)
+        user = await session_manager.get(username)
         if not user:
             return RedirectResponse(url="/login")
         user.sessionId = str(uuid.uuid4())
     except Exception:
         return RedirectResponse(url="/login")
 
-    return templates.TemplateResponse("home.html", {"request": request, "user": user})
+    # Assemble the page from the fragments the session last streamed; the
+    # page's stream resumes from the same event, so nothing is sent twice
+    username = user.username
+    fragments = {
+        "posts": page_fragment(user, f"ol_{username}", lambda: post_list_renderer.render_window(
+            username, *user.post_window()
+        )),
+        "title": page_fragment(user, f"post_title_length_{username}", lambda: fragment_templates.expand(
+            "posts_title", username=username, count=user.post_count
+        )),
+        "generate_button": page_fragment(user, f"btn_{username}", lambda: render_generate_button(user)["html"][
+            f"btn_{username}"
+        ]),
+    }
+    return templates.TemplateResponse(
+        "home.html",
+        {"request": request, "user": user, "fragments": fragments, "last_event_id": user.snapshot_event_id}
+    )
 
 @app.get("/login", response_class=HTMLResponse)
 async def login_page(request: Request):
@@ -65,7 +341,7 @@ async def login_page(request: Request):
 
 @app.post("/login")
 async def login(request: Request, username: str = Form(...), password: str = Form(...)):
-    user = await verify_credentials(username, password)
+    user = await session_manager.authenticate(username, password)
     if not user:
         return templates.TemplateResponse(
             "login.html", 
@@ -90,7 +366,7 @@ async def logout(request: Request):
         try:
             username = base64.b64decode(auth_token).decode().split(":")[0]
             # Clean up the user session on logout
-            user_sessions.pop(username, None)
+            await session_manager.logout(username)
         except Exception:
             pass
     
@@ -106,138 +382,73 @@ async def add_post(request: Request, post_content: str = Form(...)):
 
     try:
         username = base64.b64decode(auth_token).decode().split(":")[0]
-        user = user_sessions.get(username)
+        user = await session_manager.get(username)
         if not user:
             return JSONResponse({"error": "Unauthorized"}, status_code=401)
     except Exception:
         return JSONResponse({"error": "Unauthorized"}, status_code=401)
 
-    # Add the new post
+    # Add the new post; the list, counter and chart follow from the change
     user.add_post(post_content)
-    
-    # Update posts list with delete buttons
-    posts_html = (
-        f'<ol id="ol_{user.username}" style="background: #f8f9fa; padding: 1.5rem; border-radius: 4px; min-height: 200px;">'
-    )
-    
-    if user.posts:
-        for i, post in enumerate(user.posts):
-            posts_html += f'''
-                <li style="padding: 0.5rem 0; border-bottom: 1px solid #eee; display: flex; justify-content: space-between; align-items: center;">
-                    <span>{i+1}. {post}</span>
-                    <form sx-post="/delete_post" sx-swap="none" style="margin: 0;">
-                        <input type="hidden" name="post_index" value="{i}">
-                        <button type="submit" id="delete_btn_{i}"
-                                style="background: #dc3545; color: white; border: none; padding: 0.25rem 0.5rem; border-radius: 3px; cursor: pointer; font-size: 0.8rem;">
-                            🗑️ Delete
-                        </button>
-                    </form>
-                </li>
-            '''
-    else:
-        posts_html += '<li style="color: #666; font-style: italic;">No posts yet. Add some above! 👆</li>'
-    
-    posts_html += '</ol>'
-    await user.send_html_update(f"ol_{user.username}", posts_html)
+    await session_manager.save(user)
     
     # Send form reset command using SSEXI format
     await user.send_js_execution('document.getElementById("addPostForm").reset();')
-
-    # update the h2
-    await user.send_html_update(
-        f"post_title_length_{ user.username }", 
-        f'<h2 id="post_title_length_{user.username}"> 📋 Your Posts ({user.post_count} total)</h2>'
-    )
-    
-    # Update chart in real-time via SSEXI JS variable
-    chart_data = { 'x': user.post_count , 'y': user.post_count }
-    await user.send_js_execution(f'myChart.data.datasets[0].data = [{chart_data}]; myChart.update();')
+    await user.flush_changes()
 
     return {"status": "success"}
 
 @app.post("/generate_posts")
 async def generate_posts(request: Request):
-    """SSEXI-powered endpoint for generating random posts"""
+    """SSEXI-powered endpoint for generating random posts in the background"""
     auth_token = request.cookies.get("auth_token")
     if not auth_token:
         return JSONResponse({"error": "Unauthorized"}, status_code=401)
 
     try:
         username = base64.b64decode(auth_token).decode().split(":")[0]
-        user = user_sessions.get(username)
+        user = await session_manager.get(username)
         if not user:
             return JSONResponse({"error": "Unauthorized"}, status_code=401)
     except Exception:
         return JSONResponse({"error": "Unauthorized"}, status_code=401)
 
-    # Disable the button using SSEXI
-    await user.send_html_update(
-        f"btn_{user.username}", 
-        f'''<button id="btn_{ user.username }" type="submit"
-          style="width: 100%; border: none; padding: 0.75rem; border-radius: 4px; cursor: pointer; font-size: 1rem;"
-          disabled>
-          🎯 Generate 5 Posts
-          </button>
-        '''
-    )
+    job = job_runner.submit(user.username, "generate_posts", lambda: generate_posts_job(user.username))
+    if job is None:
+        return JSONResponse({"error": "A job is already running"}, status_code=429)
 
-    for i in range(5):
-        # Generate random post
-        random_post = ''.join(random.choices(string.ascii_letters + string.digits, k=10))
-        user.add_post(random_post)
-        
-        # Update posts list with delete buttons
-        posts_html = (
-            f'<ol id="ol_{user.username}" style="background: #f8f9fa; padding: 1.5rem; border-radius: 4px; min-height: 200px;">'
-        )
-        
-        if user.posts:
-            for j, post in enumerate(user.posts):
-                posts_html += f'''
-                    <li style="padding: 0.5rem 0; border-bottom: 1px solid #eee; display: flex; justify-content: space-between; align-items: center;">
-                        <span>{j+1}. {post}</span>
-                        <form sx-post="/delete_post" sx-swap="none" style="margin: 0;">
-                            <input type="hidden" name="post_index" value="{j}">
-                            <button type="submit" id="delete_btn_{j}"
-                                    style="background: #dc3545; color: white; border: none; padding: 0.25rem 0.5rem; border-radius: 3px; cursor: pointer; font-size: 0.8rem;">
-                                🗑️ Delete
-                            </button>
-                        </form>
-                    </li>
-                '''
-        else:
-            posts_html += '<li style="color: #666; font-style: italic;">No posts yet. Add some above! 👆</li>'
-        
-        posts_html += '</ol>'
-        await user.send_html_update(f"ol_{user.username}", posts_html)
-        
-        # Update counter in real-time during generation
-        await user.send_html_update(
-            f"post_title_length_{ user.username }", 
-            f'<h2 id="post_title_length_{user.username}"> 📋 Your Posts ({user.post_count} total)</h2>'
-        )
-
-        # Update chart in real-time via SSEXI JS variable
-        chart_data = { 'x': user.post_count , 'y': user.post_count }
-        await user.send_js_execution(f'myChart.data.datasets[0].data = [{chart_data}]; myChart.update();')
-        
-        
-        await asyncio.sleep(0.5)
-
-    # Re-enable the button using SSEXI
-    await user.send_html_update(
-        f"btn_{user.username}", 
-        f'''<button id="btn_{ user.username }" type="submit"
-            style="width: 100%; background: #6c757d; color: white; border: 2px solid black; padding: 0.75rem; border-radius: 4px; cursor: pointer; font-size: 1rem;">
-            🎯 Generate 5 Posts
-            </button>
-        '''
-    )
-    
-    # Send success notificationlee[p]
-    await user.send_js_execution("console.log('✅ Generated 5 random posts!');")
+    return JSONResponse({"status": "accepted", "job_id": job.id}, status_code=202)
 
-    return {"status": "success"}
+async def generate_posts_job(username: str):
+    """Add random posts, streaming progress to the user's page"""
+    try:
+        for i in range(GENERATE_POSTS_COUNT):
+            # Looked up for every post so we save on top of the latest state,
+            # not the one the job started with
+            user = await session_manager.get(username)
+            if user is None:
+                return
+
+            # Generate random post
+            random_post = ''.join(random.choices(string.ascii_letters + string.digits, k=10))
+            user.add_post(random_post)
+            # The button shows progress while disabled
+            user.generate_progress = i + 1
+            await session_manager.save(user)
+            await user.flush_changes()
+
+            await asyncio.sleep(0.5)
+    finally:
+        # Re-enable the button, also when the job was cancelled or failed;
+        # only a session still in memory, an evicted one isn't brought back
+        user = session_backend.local_sessions.get(username)
+        if user is not None:
+            user.generate_progress = None
+            await user.flush_changes()
+
+    # Send success notification
+    if user is not None:
+        await user.send_js_execution(f"console.log('✅ Generated {GENERATE_POSTS_COUNT} random posts!');")
 
 @app.post("/get_server_message")
 async def get_server_message(request: Request):
@@ -248,7 +459,7 @@ async def get_server_message(request: Request):
 
     try:
         username = base64.b64decode(auth_token).decode().split(":")[0]
-        user = user_sessions.get(username)
+        user = await session_manager.get(username)
         if not user:
             return JSONResponse({"error": "Unauthorized"}, status_code=401)
     except Exception:
@@ -260,101 +471,213 @@ async def get_server_message(request: Request):
     return {"status": "success"}
 
 @app.post("/delete_post")
-async def delete_post(request: Request, post_index: int = Form(...)):
-    """Delete a post by index"""
+async def delete_post(request: Request, post_id: int = Form(...)):
+    """Delete a post by id"""
     auth_token = request.cookies.get("auth_token")
     if not auth_token:
         return JSONResponse({"error": "Unauthorized"}, status_code=401)
 
     try:
         username = base64.b64decode(auth_token).decode().split(":")[0]
-        user = user_sessions.get(username)
+        user = await session_manager.get(username)
         if not user:
             return JSONResponse({"error": "Unauthorized"}, status_code=401)
     except Exception:
         return JSONResponse({"error": "Unauthorized"}, status_code=401)
 
     # Delete the post
-    success = user.delete_post(post_index)
-    
+    success = user.delete_post(post_id)
     if success:
-        # Send updated posts list with consistent delete buttons
-        posts_html = (
-            f'<ol id="ol_{user.username}" style="background: #f8f9fa; padding: 1.5rem; border-radius: 4px; min-height: 200px;">'
-        )
-        
-        if user.posts:
-            for i, post in enumerate(user.posts):
-                posts_html += f'''
-                    <li style="padding: 0.5rem 0; border-bottom: 1px solid #eee; display: flex; justify-content: space-between; align-items: center;">
-                        <span>{i+1}. {post}</span>
-                        <form sx-post="/delete_post" sx-swap="none" style="margin: 0;">
-                            <input type="hidden" name="post_index" value="{i}">
-                            <button type="submit" id="delete_btn_{i}"
-                                    style="background: #dc3545; color: white; border: none; padding: 0.25rem 0.5rem; border-radius: 3px; cursor: pointer; font-size: 0.8rem;">
-                                🗑️ Delete
-                            </button>
-                        </form>
-                    </li>
-                '''
-        else:
-            posts_html += '<li style="color: #666; font-style: italic;">No posts yet. Add some above! 👆</li>'
-        
-        posts_html += '</ol>'
-        await user.send_html_update(f"ol_{user.username}", posts_html)
-        
-        # Update counter
-        await user.send_html_update(
-            f"post_title_length_{user.username}", 
-            f'<h2 id="post_title_length_{user.username}"> 📋 Your Posts ({user.post_count} total)</h2>'
-        )
-
-        # Update chart in real-time via SSEXI JS variable
-        chart_data = { 'x': user.post_count , 'y': user.post_count }
-        await user.send_js_execution(f'myChart.data.datasets[0].data = [{chart_data}]; myChart.update();')
+        await session_manager.save(user)
+        await user.flush_changes()
 
         # Success notification
         await user.send_js_execution("console.log('✅ Post deleted successfully!');")
     else:
         # Error notification
-        await user.send_js_execution("console.log('❌ Failed to delete post - invalid index');")
+        await user.send_js_execution("console.log('❌ Failed to delete post - unknown post');")
     
     return {"status": "success" if success else "error"}
 
+@app.post("/show_more_posts")
+async def show_more_posts(request: Request):
+    """Render another page of older posts into the list"""
+    auth_token = request.cookies.get("auth_token")
+    if not auth_token:
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+
+    try:
+        username = base64.b64decode(auth_token).decode().split(":")[0]
+        user = await session_manager.get(username)
+        if not user:
+            return JSONResponse({"error": "Unauthorized"}, status_code=401)
+    except Exception:
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+
+    user.show_more_posts(POSTS_PAGE_SIZE)
+    await user.flush_changes()
+
+    return {"status": "success"}
+
 @app.get("/stream/{username}")
-async def message_stream(username: str):
-    user = user_sessions.get(username)
-    if not user:
-        return JSONResponse({"error": "User not found"}, status_code=404)
+async def message_stream(username: str, request: Request):
+    auth_token = request.cookies.get("auth_token")
+    if not auth_token:
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
 
-    async def event_generator():
-        try:
-            while True:
-                update = await user._update_queue.get()
-                yield f"data: {json.dumps(update)}\n\n"
-        except asyncio.CancelledError:
-            # Handle disconnection
-            pass
+    try:
+        authenticated = base64.b64decode(auth_token).decode().split(":")[0]
+        user = await session_manager.get(authenticated)
+        if not user:
+            return JSONResponse({"error": "Unauthorized"}, status_code=401)
+    except Exception:
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+
+    # Only the session's owner may read its stream or use up its stream slots
+    if username != authenticated:
+        return JSONResponse({"error": "Forbidden"}, status_code=403)
+
+    # Resume after the last event the client saw; the browser sends the header
+    # itself, ssexi.js passes a query parameter when it opens a fresh EventSource
+    last_event_id = request.headers.get("last-event-id") or request.query_params.get("lastEventId")
+
+    if not stream_limiter.acquire(username):
+        return stream_limiter.reject()
+
+    # Each connection (tab) gets its own cursor over the session's frames;
+    # ssexi.js passes the version of the fragment templates it has cached
+    subscriber = user.subscribe(last_event_id, request.query_params.get("templates"))
+
+    return EventStreamResponse(
+        request,
+        subscriber,
+        heartbeat=STREAM_HEARTBEAT,
+        retry=STREAM_RETRY_MS,
+        on_close=subscriber.close,
+        limiter=stream_limiter,
+        key=username,
+        encodings=STREAM_ENCODINGS if STREAM_COMPRESSION else (),
+        min_size=STREAM_COMPRESS_MIN_SIZE,
+        size_hint=subscriber.frame_size,
+    )
+
+@app.get("/mux")
+async def mux_stream(request: Request):
+    """One stream for the channels in ?channels=a,b, more can join while it is open"""
+    auth_token = request.cookies.get("auth_token")
+    if not auth_token:
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+
+    try:
+        username = base64.b64decode(auth_token).decode().split(":")[0]
+        user = await session_manager.get(username)
+        if not user:
+            return JSONResponse({"error": "Unauthorized"}, status_code=401)
+    except Exception:
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+
+    last_event_id = request.headers.get("last-event-id") or request.query_params.get("lastEventId")
+    channels = [c for c in request.query_params.get("channels", "").split(",") if c]
 
-    return StreamingResponse(
-        event_generator(),
-        media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "Transfer-Encoding": "chunked"
-        }
+    if not stream_limiter.acquire(username):
+        return stream_limiter.reject()
+
+    connection = channel_mux.connect(username, request.query_params.get("templates"))
+    try:
+        for channel in channels:
+            await connection.subscribe(channel, last_event_id)
+    except BaseException:
+        # The response never starts, so nothing else would release these
+        connection.close()
+        stream_limiter.release(username)
+        raise
+
+    return EventStreamResponse(
+        request,
+        connection,
+        heartbeat=STREAM_HEARTBEAT,
+        retry=STREAM_RETRY_MS,
+        on_close=connection.close,
+        limiter=stream_limiter,
+        key=username,
+        encodings=STREAM_ENCODINGS if STREAM_COMPRESSION else (),
+        min_size=STREAM_COMPRESS_MIN_SIZE,
+        size_hint=connection.frame_size,
     )
 
+@app.post("/mux/{connection_id}/subscribe")
+async def mux_subscribe(connection_id: str, request: Request, channel: str = Form(...)):
+    """Add a channel to an open multiplexed stream"""
+    auth_token = request.cookies.get("auth_token")
+    if not auth_token:
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+
+    try:
+        username = base64.b64decode(auth_token).decode().split(":")[0]
+    except Exception:
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+
+    connection = channel_mux.get(connection_id, username)
+    if connection is None:
+        return JSONResponse({"error": "Stream not found"}, status_code=404)
+    if not await connection.subscribe(channel):
+        return JSONResponse({"error": "Channel not available"}, status_code=403)
+
+    return {"status": "success", "channels": connection.channels}
+
+@app.post("/mux/{connection_id}/unsubscribe")
+async def mux_unsubscribe(connection_id: str, request: Request, channel: str = Form(...)):
+    """Drop a channel from an open multiplexed stream"""
+    auth_token = request.cookies.get("auth_token")
+    if not auth_token:
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+
+    try:
+        username = base64.b64decode(auth_token).decode().split(":")[0]
+    except Exception:
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+
+    connection = channel_mux.get(connection_id, username)
+    if connection is None:
+        return JSONResponse({"error": "Stream not found"}, status_code=404)
+    connection.unsubscribe(channel)
+
+    return {"status": "success", "channels": connection.channels}
+
+@app.get("/static/{path:path}")
+async def static_file(request: Request, path: str):
+    return static_assets.response(request, path)
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus scrape endpoint"""
+    if not metrics.enabled:
+        return JSONResponse({"error": "Metrics are disabled"}, status_code=404)
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize any async resources on startup."""
-    pass
+    global loop_lag_monitor, ticker_task
+    static_assets.build()
+    await session_manager.start()
+    ticker_task = asyncio.create_task(run_ticker())
+    if metrics.enabled:
+        loop_lag_monitor = asyncio.create_task(metrics.monitor_loop_lag(EVENT_LOOP_LAG_INTERVAL))
 
 @app.on_event("shutdown")  
 async def shutdown_event():
     """Clean up any async resources on shutdown."""
-    user_sessions.clear()
+    global loop_lag_monitor, ticker_task
+    await job_runner.stop()
+    if ticker_task is not None:
+        ticker_task.cancel()
+        ticker_task = None
+    if loop_lag_monitor is not None:
+        loop_lag_monitor.cancel()
+        loop_lag_monitor = None
+    await session_manager.stop()
+    render_pool.shutdown()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,206 @@
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import asyncio
+import os
+import time
+
+# Set SSEXI_METRICS=0 to turn instrumentation off; hot paths only check this flag
+enabled = os.environ.get("SSEXI_METRICS", "1") != "0"
+
+# Frame key holding the time (epoch seconds) its first update was queued.
+# It travels with the frame through batching, backends and the session queue
+# and is removed by the hub before the frame is encoded.
+QUEUED_AT = "_queued_at"
+
+Labels = Tuple[Tuple[str, str], ...]
+Sampler = Callable[[], Iterable[Tuple[Dict[str, str], float]]]
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (128, 256, 512, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+def _labels(labels: Optional[Dict[str, str]]) -> Labels:
+    return tuple(sorted(labels.items())) if labels else ()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(str(value))}"' for key, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+
+    def samples(self) -> Iterable[str]:
+        return ()
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class _Scalar(Metric):
+    """Metric with one value per label set, optionally read at scrape time.
+
+    A callback returns ``(labels, value)`` pairs, so one metric can report a
+    value per session without being updated on every change.
+    """
+
+    def __init__(self, name: str, help: str, callback: Optional[Sampler] = None):
+        super().__init__(name, help)
+        self._values: Dict[Labels, float] = {}
+        self.callback = callback
+
+    def samples(self) -> Iterable[str]:
+        values = dict(self._values)
+        if self.callback is not None:
+            for labels, value in self.callback():
+                values[_labels(labels)] = value
+        for labels, value in values.items():
+            yield f"{self.name}{_format_labels(labels)} {_format_value(value)}"
+
+
+class Counter(_Scalar):
+    type = "counter"
+
+    def inc(self, amount: float = 1, labels: Optional[Dict[str, str]] = None) -> None:
+        key = _labels(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Scalar):
+    type = "gauge"
+
+    def set(self, value: float, labels: Optional[Dict[str, str]] = None) -> None:
+        self._values[_labels(labels)] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help)
+        self._buckets = tuple(buckets)
+        self._series: Dict[Labels, List[float]] = {}
+
+    def observe(self, value: float, labels: Optional[Dict[str, str]] = None) -> None:
+        key = _labels(labels)
+        series = self._series.get(key)
+        if series is None:
+            # Per-bucket counts, then +Inf count and sum
+            series = self._series[key] = [0] * (len(self._buckets) + 1) + [0.0]
+        series[bisect_left(self._buckets, value)] += 1
+        series[-1] += value
+
+    def samples(self) -> Iterable[str]:
+        for labels, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self._buckets + (float("inf"),), series):
+                cumulative += count
+                yield f"{self.name}_bucket{_format_labels(labels, ('le', _format_value(bound)))} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(labels)} {_format_value(series[-1])}"
+            yield f"{self.name}_count{_format_labels(labels)} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format"""
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+registry = Registry()
+
+DELIVERY_LATENCY = registry.register(Histogram(
+    "ssexi_update_delivery_seconds",
+    "Time from queue_update to the frame being handed to a stream",
+))
+FRAME_BYTES = registry.register(Histogram(
+    "ssexi_frame_bytes",
+    "Size of encoded SSE frames",
+    SIZE_BUCKETS,
+))
+ROUTE_DURATION = registry.register(Histogram(
+    "ssexi_http_request_duration_seconds",
+    "Time spent in route handlers until the response starts",
+))
+LOOP_LAG = registry.register(Histogram(
+    "ssexi_event_loop_lag_seconds",
+    "How late the event loop woke up a sleeping task",
+))
+RENDER_POOL_WAIT = registry.register(Histogram(
+    "ssexi_render_pool_wait_seconds",
+    "Time offloaded rendering work waited for a free worker",
+))
+
+
+def stamp(update: dict) -> None:
+    """Mark when an update was queued"""
+    update[QUEUED_AT] = time.time()
+
+
+def observe_delivery(queued_at: Optional[float]) -> None:
+    if queued_at is not None:
+        DELIVERY_LATENCY.observe(max(0.0, time.time() - queued_at))
+
+
+async def monitor_loop_lag(interval: float = 0.5) -> None:
+    """Record how much later than scheduled each wakeup happens"""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        LOOP_LAG.observe(max(0.0, loop.time() - expected))
+
+
+class RouteTimingMiddleware:
+    """ASGI middleware timing each route until its response starts.
+
+    Streaming responses are timed up to their headers, so a long-lived SSE
+    stream counts the handler's setup work rather than the connection's life.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+
+        async def timed_send(message) -> None:
+            if message["type"] == "http.response.start":
+                # The router stores the matched route in the shared scope
+                route = scope.get("route")
+                ROUTE_DURATION.observe(
+                    time.perf_counter() - start,
+                    {"method": scope["method"], "route": getattr(route, "path", "unmatched")},
+                )
+            await send(message)
+
+        await self.app(scope, receive, timed_send)
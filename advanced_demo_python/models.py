@@ -1,11 +1,91 @@
-from typing import Optional, List
+from typing import Dict, Iterator, Optional, List, Tuple, TYPE_CHECKING
+from itertools import islice, takewhile
 import asyncio
+from batching import UpdateBatcher, merge_update
+from hub import SessionHub, Subscriber
+from queues import SessionQueue
+from reactive import ReactiveState, observable
+import metrics
+
+if TYPE_CHECKING:
+    from backends import SessionBackend
+
+class PostStore:
+    """Ordered posts keyed by stable ids.
+
+    Ids are never reused, so a rendered item (and the delete form in it)
+    stays valid however many posts are added or removed around it. Posts
+    live in an insertion-ordered dict: adding and deleting by id are O(1)
+    and iteration is oldest first.
+    """
+
+    def __init__(self):
+        self._posts: Dict[int, str] = {}
+        self._next_id = 1
+
+    def __len__(self) -> int:
+        return len(self._posts)
+
+    def __iter__(self) -> Iterator[Tuple[int, str]]:
+        return iter(self._posts.items())
+
+    def __contains__(self, post_id: int) -> bool:
+        return post_id in self._posts
+
+    def add(self, content: str) -> int:
+        """Append a post, returns its id"""
+        post_id = self._next_id
+        self._next_id += 1
+        self._posts[post_id] = content
+        return post_id
+
+    def remove(self, post_id: int) -> bool:
+        """Delete a post by id, returns True if it existed"""
+        return self._posts.pop(post_id, None) is not None
+
+    def latest(self, limit: int) -> List[Tuple[int, str]]:
+        """Get the newest ``limit`` posts, oldest first"""
+        newest = list(islice(reversed(self._posts.items()), limit))
+        newest.reverse()
+        return newest
+
+    def since(self, post_id: int) -> List[Tuple[int, str]]:
+        """Get the posts from ``post_id`` on, oldest first"""
+        newer = list(takewhile(lambda item: item[0] >= post_id, reversed(self._posts.items())))
+        newer.reverse()
+        return newer
+
+    def to_state(self) -> dict:
+        """Get a JSON-serializable copy of the store"""
+        return {"next_id": self._next_id, "posts": list(self._posts.items())}
+
+    @classmethod
+    def from_state(cls, state: dict) -> "PostStore":
+        store = cls()
+        store._posts = {int(post_id): content for post_id, content in state["posts"]}
+        store._next_id = state["next_id"]
+        return store
+
 
 class Homepage:
+    # Number of newest posts shown in the list, None to show them all
+    post_limit = observable(None)
+    # Posts generated so far by a running generate_posts job, None when idle
+    generate_progress = observable(None)
+
     def __init__(self, username: str):
         self._username = username
-        self._posts = []
-        self._update_queue: Optional[asyncio.Queue] = None
+        self._posts = PostStore()
+        # Oldest post in the window, see post_window
+        self._window_start: Optional[int] = None
+        self._reactive: Optional[ReactiveState] = None
+        self._flush_lock = asyncio.Lock()
+        self._update_queue: Optional[SessionQueue] = None
+        # Flush resending everything after the queue dropped a frame
+        self._resync: Optional[asyncio.Task] = None
+        self._batcher: Optional[UpdateBatcher] = None
+        self._hub: Optional[SessionHub] = None
+        self._backend: Optional["SessionBackend"] = None
         self._btnPressed = False
         self._sessionId = ''
         self._hiddenMsg = "🎉 Secret message from the server!"
@@ -15,7 +95,7 @@ class Homepage:
         return self._username
 
     @property
-    def posts(self) -> List[str]:
+    def posts(self) -> PostStore:
         return self._posts
 
     @property
@@ -45,24 +125,115 @@ class Homepage:
         """Get the hidden message"""
         return self._hiddenMsg
 
-    def add_post(self, content: str) -> None:
-        """Add a post to the list"""
-        self._posts.append(content)
+    def add_post(self, content: str) -> int:
+        """Add a post to the list, returns its id"""
+        post_id = self._posts.add(content)
+        self._changed("posts", "post_count")
+        return post_id
 
-    def delete_post(self, index: int) -> bool:
-        """Delete a post by index, returns True if successful"""
-        try:
-            if 0 <= index < len(self._posts):
-                self._posts.pop(index)
-                return True
-            return False
-        except (IndexError, ValueError):
+    def delete_post(self, post_id: int) -> bool:
+        """Delete a post by id, returns True if successful"""
+        if not self._posts.remove(post_id):
             return False
+        self._changed("posts", "post_count")
+        return True
+
+    def post_window(self) -> Tuple[List[Tuple[int, str]], int]:
+        """Get the posts to show, oldest first, and how many are hidden
+
+        The window stays anchored on its oldest post while posts are added
+        and deleted, so the list grows and shrinks in place instead of
+        sliding and changing every item. It moves to the newest
+        ``post_limit`` posts once it has emptied or doubled.
+        """
+        limit = self.post_limit
+        if limit is None:
+            return list(self._posts), 0
+        visible = [] if self._window_start is None else self._posts.since(self._window_start)
+        if not visible or len(visible) > 2 * limit:
+            visible = self._posts.latest(limit)
+            self._window_start = visible[0][0] if visible else None
+        return visible, len(self._posts) - len(visible)
+
+    def show_more_posts(self, count: int) -> None:
+        """Widen the posts window by ``count`` older posts"""
+        if self.post_limit is not None:
+            visible = self._posts.latest(len(self.post_window()[0]) + count)
+            self._window_start = visible[0][0] if visible else None
+            self.post_limit += count
+
+    def subscribe(self, last_event_id: Optional[str] = None, templates: Optional[str] = None) -> Subscriber:
+        """Attach a stream, resuming after ``last_event_id`` when given"""
+        return self._hub.subscribe(last_event_id, templates)
+
+    def cached_fragment(self, element_id: str) -> Optional[str]:
+        """Get the HTML last streamed for ``element_id``, None if never sent"""
+        if self._hub is None:
+            return None
+        return self._hub.snapshots.fragment(element_id)
+
+    @property
+    def snapshot_event_id(self) -> Optional[str]:
+        """Event id the cached fragments are current as of"""
+        return None if self._hub is None else self._hub.last_event_id
+
+    def close_streams(self) -> None:
+        """End every stream attached to this session"""
+        if self._hub is not None:
+            self._hub.close()
 
     async def queue_update(self, update_data: dict) -> None:
         """Queue SSE update - supports SSEXI message format"""
-        if self._update_queue is not None:
-            await self._update_queue.put(update_data)
+        if metrics.enabled:
+            metrics.stamp(update_data)
+        if self._batcher is not None:
+            await self._batcher.add(update_data)
+        else:
+            await self._deliver(update_data)
+
+    async def flush_changes(self) -> None:
+        """Render and queue, as one frame, the updates bound to changed fields"""
+        if self._reactive is None:
+            return
+        # Renders may await a worker; one flush at a time keeps frames in order
+        async with self._flush_lock:
+            frame: dict = {}
+            for update in await self._reactive.collect(self):
+                merge_update(frame, update)
+            if frame:
+                await self.queue_update(frame)
+
+    async def flush_updates(self) -> None:
+        """Send any batched updates immediately"""
+        if self._batcher is not None:
+            await self._batcher.flush()
+
+    def _changed(self, *fields: str) -> None:
+        if self._reactive is not None:
+            self._reactive.mark(*fields)
+
+    async def _deliver(self, frame: dict) -> None:
+        # The backend routes the frame to whichever process holds our streams
+        if self._backend is not None:
+            await self._backend.publish(self._username, frame)
+        else:
+            await self._enqueue(frame)
+
+    async def _enqueue(self, frame: dict) -> None:
+        if self._hub is not None and self._hub.idle:
+            # No stream is draining the queue; keep the page snapshot current
+            self._hub.absorb(frame)
+            return
+        queue = self._update_queue
+        if queue is None:
+            return
+        dropped = queue.dropped
+        await queue.put(frame)
+        if queue.dropped != dropped and self._reactive is not None:
+            # The lost frame may have held an element's latest markup
+            self._reactive.invalidate()
+            if self._resync is None or self._resync.done():
+                self._resync = asyncio.create_task(self.flush_changes())
 
     async def send_html_update(self, element_id: str, html_content: str) -> None:
         """Helper method to send HTML updates in SSEXI format"""
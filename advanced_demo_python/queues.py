@@ -0,0 +1,108 @@
+from collections import deque
+import asyncio
+
+# Overflow policies for SessionQueue
+DROP_OLDEST = "drop_oldest"
+LATEST_WINS = "latest_wins"
+BLOCK = "block"
+
+OVERFLOW_POLICIES = (DROP_OLDEST, LATEST_WINS, BLOCK)
+
+
+class SessionQueue(asyncio.Queue):
+    """Bounded queue of SSEXI frames for a single session.
+
+    Policies applied when a frame is put:
+
+    * ``drop_oldest`` - a full queue discards its oldest frame to make room.
+    * ``latest_wins`` - HTML for an element id replaces the same id in every
+      frame still queued, so only the newest snapshot is kept; a full queue
+      then falls back to dropping the oldest frame.
+    * ``block`` - producers wait up to ``put_timeout`` seconds for room and
+      the new frame is dropped if none frees up.
+    """
+
+    def __init__(self, maxsize: int = 64, policy: str = LATEST_WINS, put_timeout: float = 1.0):
+        if maxsize <= 0:
+            raise ValueError("SessionQueue must be bounded")
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {policy}")
+        super().__init__(maxsize)
+        self._policy = policy
+        self._put_timeout = put_timeout
+        self._dropped = 0
+        self._superseded = 0
+
+    @property
+    def policy(self) -> str:
+        return self._policy
+
+    @property
+    def dropped(self) -> int:
+        """Number of whole frames discarded because the queue was full"""
+        return self._dropped
+
+    @property
+    def superseded(self) -> int:
+        """Number of queued HTML fragments replaced by a newer one"""
+        return self._superseded
+
+    def stats(self) -> dict:
+        """Get queue depth and drop counters"""
+        return {
+            "depth": self.qsize(),
+            "maxsize": self.maxsize,
+            "policy": self._policy,
+            "dropped": self._dropped,
+            "superseded": self._superseded,
+        }
+
+    async def put(self, item: dict) -> bool:
+        """Put a frame, returns False if it was dropped"""
+        if self._policy != BLOCK:
+            return self.put_nowait(item)
+
+        try:
+            await asyncio.wait_for(super().put(item), self._put_timeout)
+            return True
+        except asyncio.TimeoutError:
+            self._dropped += 1
+            return False
+
+    def put_nowait(self, item: dict) -> bool:
+        """Put a frame without waiting, applying the overflow policy"""
+        if self._policy == BLOCK:
+            if self.full():
+                self._dropped += 1
+                return False
+        else:
+            if self._policy == LATEST_WINS:
+                self._supersede(item)
+            while self.full():
+                self.get_nowait()
+                self.task_done()
+                self._dropped += 1
+
+        super().put_nowait(item)
+        return True
+
+    def _supersede(self, item: dict) -> None:
+        element_ids = item.get("html", {}).keys()
+        if not element_ids or not self._queue:
+            return
+
+        kept = deque()
+        for frame in self._queue:
+            html_updates = frame.get("html")
+            if html_updates:
+                for element_id in element_ids:
+                    if html_updates.pop(element_id, None) is not None:
+                        self._superseded += 1
+                if not html_updates:
+                    del frame["html"]
+            if "html" in frame or "js" in frame:
+                kept.append(frame)
+            else:
+                self.task_done()
+
+        self._queue = kept
@@ -0,0 +1,88 @@
+from typing import Any, Awaitable, Callable, Dict, List, Sequence, Set, Union
+import inspect
+
+
+class Binding:
+    """An SSEXI update (fragment or JS) rendered from some of a model's fields.
+
+    ``render`` may be a coroutine function, e.g. to render on a worker.
+    """
+
+    def __init__(self, name: str, depends_on: Sequence[str], render: Callable[[Any], Union[dict, Awaitable[dict]]]):
+        self.name = name
+        self.depends_on = frozenset(depends_on)
+        self.render = render
+
+
+class ReactiveState:
+    """Dirty tracking for the updates bound to a model.
+
+    Mutations ``mark`` the fields they changed. ``collect`` then renders only
+    the bindings depending on a marked field, and skips any whose output is
+    the same as the last one sent.
+    """
+
+    def __init__(self, bindings: Sequence[Binding]):
+        self._bindings = list(bindings)
+        self._dirty: Set[str] = set()
+        self._sent: Dict[str, dict] = {}
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self._dirty)
+
+    def mark(self, *fields: str) -> None:
+        self._dirty.update(fields)
+
+    def forget(self) -> None:
+        """Drop what was last sent, e.g. after state was reloaded from elsewhere"""
+        self._sent.clear()
+
+    def invalidate(self) -> None:
+        """Render and send every binding on the next collect, e.g. after a frame was lost"""
+        self._sent.clear()
+        for binding in self._bindings:
+            self._dirty.update(binding.depends_on)
+
+    async def collect(self, model) -> List[dict]:
+        """Render the updates for everything marked since the last collect"""
+        if not self._dirty:
+            return []
+        fields, self._dirty = self._dirty, set()
+
+        updates = []
+        for binding in self._bindings:
+            if binding.depends_on.isdisjoint(fields):
+                continue
+            update = binding.render(model)
+            if inspect.isawaitable(update):
+                update = await update
+            if self._sent.get(binding.name) != update:
+                self._sent[binding.name] = update
+                updates.append(update)
+        return updates
+
+
+class observable:
+    """Model attribute that marks itself changed when assigned a new value.
+
+    The value lives in ``_<name>`` and the owner's ``_changed(name)`` is
+    called on every assignment that changes it.
+    """
+
+    def __init__(self, default=None):
+        self._default = default
+
+    def __set_name__(self, owner, name: str) -> None:
+        self._name = name
+        self._attr = f"_{name}"
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        return getattr(obj, self._attr, self._default)
+
+    def __set__(self, obj, value) -> None:
+        if getattr(obj, self._attr, self._default) != value:
+            setattr(obj, self._attr, value)
+            obj._changed(self._name)
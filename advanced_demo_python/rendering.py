@@ -0,0 +1,85 @@
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional, Tuple
+import asyncio
+import time
+import metrics
+
+RENDER_POOL_KINDS = ("thread", "process")
+
+
+def _timed_call(fn: Callable[..., Any], *args) -> Tuple[float, Any]:
+    # Runs in the worker; wall-clock time so it compares across processes
+    return time.time(), fn(*args)
+
+
+class RenderPool:
+    """Executor for rendering and encoding too large to run on the event loop.
+
+    Work smaller than ``threshold`` characters runs inline, where handing it
+    to a worker would cost more than doing it. Larger work goes to a thread
+    pool or, with ``kind="process"``, a process pool, which also sidesteps
+    the GIL but only takes picklable module-level functions and can't see
+    the server's state. Callers flag work that reads or updates shared state
+    (caches, diff bases) as ``stateful``; it is only offloaded to threads.
+
+    Awaiting ``run`` keeps each caller's work in order, so a session that
+    awaits its renders one after another still sends frames in order.
+    """
+
+    def __init__(self, kind: str = "thread", max_workers: int = 4, threshold: int = 64_000):
+        if kind not in RENDER_POOL_KINDS:
+            raise ValueError(f"Unknown render pool kind: {kind!r}")
+        self.kind = kind
+        self.max_workers = max_workers
+        self.threshold = threshold
+        self._executor: Optional[Executor] = None
+        self._pending = 0
+        self.offloaded = 0
+        self.inline = 0
+
+    @property
+    def shares_memory(self) -> bool:
+        return self.kind == "thread"
+
+    @property
+    def pending(self) -> int:
+        """Tasks submitted and not finished yet"""
+        return self._pending
+
+    @property
+    def saturation(self) -> float:
+        """Pending tasks per worker; above 1 work is queueing"""
+        return self._pending / self.max_workers
+
+    def offloads(self, size: int, stateful: bool = False) -> bool:
+        """Whether work of ``size`` characters would leave the event loop"""
+        return size >= self.threshold and (self.shares_memory or not stateful)
+
+    async def run(self, size: int, fn: Callable[..., Any], *args, stateful: bool = False) -> Any:
+        """Call ``fn(*args)``, on the pool when ``size`` reaches the threshold"""
+        if not self.offloads(size, stateful):
+            self.inline += 1
+            return fn(*args)
+
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix="render")
+        self.offloaded += 1
+        self._pending += 1
+        submitted = time.time()
+        try:
+            started, result = await asyncio.get_running_loop().run_in_executor(
+                self._executor, _timed_call, fn, *args
+            )
+        finally:
+            self._pending -= 1
+        if metrics.enabled:
+            metrics.RENDER_POOL_WAIT.observe(max(0.0, started - submitted))
+        return result
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
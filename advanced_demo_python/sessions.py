@@ -0,0 +1,125 @@
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+import asyncio
+import secrets
+import time
+from backends import SessionBackend
+from models import Homepage
+
+# Reasons passed to eviction hooks
+EXPIRED = "expired"
+CAPACITY = "capacity"
+LOGOUT = "logout"
+
+EvictionHook = Callable[[Homepage, str], None]
+
+
+class SessionManager:
+    """Authenticate users and bound how many sessions stay in memory.
+
+    Every lookup marks a session as recently used. Sessions idle for longer
+    than ``idle_ttl`` seconds are evicted by a background reaper, and the
+    least recently used session is evicted whenever more than
+    ``max_sessions`` are held. Eviction closes the session's streams and
+    runs the registered hooks.
+    """
+
+    def __init__(
+        self,
+        backend: SessionBackend,
+        users: Dict[str, str],
+        idle_ttl: float = 1800,
+        max_sessions: int = 10_000,
+        reap_interval: float = 60,
+    ):
+        self._backend = backend
+        self._users = users
+        self._idle_ttl = idle_ttl
+        self._max_sessions = max_sessions
+        self._reap_interval = reap_interval
+        self._last_seen: "OrderedDict[str, float]" = OrderedDict()
+        self._hooks: List[EvictionHook] = []
+        self._reaper: Optional[asyncio.Task] = None
+        self.evicted = 0
+
+    @property
+    def backend(self) -> SessionBackend:
+        return self._backend
+
+    def __len__(self) -> int:
+        return len(self._last_seen)
+
+    def add_eviction_hook(self, hook: EvictionHook) -> None:
+        """Call ``hook(homepage, reason)`` whenever a session is evicted"""
+        self._hooks.append(hook)
+
+    async def start(self) -> None:
+        await self._backend.start()
+        self._reaper = asyncio.create_task(self._reap())
+
+    async def stop(self) -> None:
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        self._last_seen.clear()
+        await self._backend.stop()
+
+    async def authenticate(self, username: str, password: str) -> Optional[Homepage]:
+        """Verify user credentials and create/return Homepage instance."""
+        expected = self._users.get(username)
+        if expected is None or not secrets.compare_digest(password, expected):
+            return None
+        homepage = await self._backend.create(username)
+        await self._touch(username)
+        return homepage
+
+    async def get(self, username: str) -> Optional[Homepage]:
+        """Get a logged in user's Homepage, marking it as recently used"""
+        homepage = await self._backend.get(username)
+        if homepage is None:
+            self._last_seen.pop(username, None)
+            return None
+        await self._touch(username)
+        return homepage
+
+    async def save(self, homepage: Homepage) -> None:
+        await self._backend.save(homepage)
+
+    async def logout(self, username: str) -> None:
+        self._last_seen.pop(username, None)
+        homepage = await self._backend.remove(username)
+        if homepage is not None:
+            self._run_hooks(homepage, LOGOUT)
+
+    async def evict(self, username: str, reason: str) -> None:
+        """Release a session from memory and close its streams"""
+        self._last_seen.pop(username, None)
+        homepage = await self._backend.evict(username)
+        if homepage is not None:
+            self.evicted += 1
+            self._run_hooks(homepage, reason)
+
+    async def reap(self) -> None:
+        """Evict every session idle for longer than the TTL"""
+        cutoff = time.monotonic() - self._idle_ttl
+        while self._last_seen:
+            username, last_seen = next(iter(self._last_seen.items()))
+            if last_seen > cutoff:
+                break
+            await self.evict(username, EXPIRED)
+
+    async def _touch(self, username: str) -> None:
+        self._last_seen[username] = time.monotonic()
+        self._last_seen.move_to_end(username)
+        while len(self._last_seen) > self._max_sessions:
+            oldest = next(iter(self._last_seen))
+            await self.evict(oldest, CAPACITY)
+
+    def _run_hooks(self, homepage: Homepage, reason: str) -> None:
+        for hook in self._hooks:
+            hook(homepage, reason)
+
+    async def _reap(self) -> None:
+        while True:
+            await asyncio.sleep(self._reap_interval)
+            await self.reap()
@@ -0,0 +1,47 @@
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class SnapshotStore:
+    """Latest state of every element and JS variable a session has sent.
+
+    Fed each frame as it is published (or absorbed by an idle hub), before
+    diffing, so it holds the last whole HTML sent for every element id and
+    the last value of every JS variable (``exec`` code isn't state and isn't
+    kept). ``frame`` gives all
+    of it as one state frame for streams that connect, and ``fragment``
+    lets a page be assembled from what was sent instead of rendering again.
+    """
+
+    def __init__(self):
+        self._html: Dict[str, str] = {}
+        self._js: Dict[str, Any] = {}
+        # Encodings of the current state, dropped on every update
+        self._encoded: Dict[Hashable, bytes] = {}
+
+    def __bool__(self) -> bool:
+        return bool(self._html or self._js)
+
+    def update(self, frame: dict) -> None:
+        self._html.update(frame.get("html", {}))
+        self._js.update((k, v) for k, v in frame.get("js", {}).items() if k != "exec")
+        self._encoded.clear()
+
+    def fragment(self, element_id: str) -> Optional[str]:
+        """Get the HTML last sent for ``element_id``"""
+        return self._html.get(element_id)
+
+    def frame(self) -> dict:
+        """Get the whole state as a single frame"""
+        frame: dict = {}
+        if self._html:
+            frame["html"] = dict(self._html)
+        if self._js:
+            frame["js"] = dict(self._js)
+        return frame
+
+    def encoded(self, key: Hashable, encode: Callable[[dict], bytes]) -> bytes:
+        """Encode the state frame, reusing the result until the next update"""
+        data = self._encoded.get(key)
+        if data is None:
+            data = self._encoded[key] = encode(self.frame())
+        return data
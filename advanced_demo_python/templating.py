@@ -0,0 +1,107 @@
+from collections import OrderedDict
+from typing import Dict, List, Optional, Union
+import hashlib
+import html
+import json
+import re
+import threading
+from diffing import split_fragment
+
+# Placeholders in fragment templates, filled with HTML-escaped parameters
+TEMPLATE_PARAM = re.compile(r"\{\{(\w+)\}\}")
+
+TemplateRef = Dict[str, object]
+
+
+def fill_template(source: str, params: dict) -> str:
+    """Substitute HTML-escaped ``params`` into a template's placeholders"""
+    return TEMPLATE_PARAM.sub(lambda m: html.escape(str(params[m.group(1)])), source)
+
+
+class TemplateRegistry:
+    """Named fragment templates that clients can expand themselves.
+
+    A template is markup with ``{{name}}`` placeholders. ``expand`` renders
+    one on the server and remembers which template and parameters produced
+    the markup, so ``compact`` can later swap that markup in a frame for a
+    ``{"tpl": name, "params": {...}}`` reference, for clients that hold the
+    definitions. Clients without them keep receiving the full HTML.
+
+    ``version`` is a hash of every definition, letting clients cache them
+    between page loads and only be sent them again when they change.
+    """
+
+    def __init__(self, budget: int = 4096):
+        self._templates: Dict[str, str] = {}
+        # Rendered markup (stripped) -> the reference that produced it, LRU
+        self._origins: "OrderedDict[str, TemplateRef]" = OrderedDict()
+        self._budget = budget
+        self._version: Optional[str] = None
+        self._lock = threading.Lock()
+
+    @property
+    def version(self) -> str:
+        if self._version is None:
+            encoded = json.dumps(self._templates, sort_keys=True).encode()
+            self._version = hashlib.sha256(encoded).hexdigest()[:12]
+        return self._version
+
+    def register(self, name: str, source: str) -> None:
+        self._templates[name] = source
+        self._version = None
+
+    def definitions(self) -> dict:
+        """Get the payload of a ``templates`` frame"""
+        return {"version": self.version, "templates": dict(self._templates)}
+
+    def expand(self, name: str, **params) -> str:
+        """Render template ``name`` with ``params``"""
+        markup = fill_template(self._templates[name], params)
+        key = markup.strip()
+        with self._lock:
+            self._origins[key] = {"tpl": name, "params": params}
+            self._origins.move_to_end(key)
+            while len(self._origins) > self._budget:
+                self._origins.popitem(last=False)
+        return markup
+
+    def reference(self, markup: str, split: bool = False) -> Union[TemplateRef, List[TemplateRef], None]:
+        """Get the reference that rendered ``markup``, None if unknown.
+
+        With ``split``, markup made of several sibling fragments gets a list
+        of references when every one of them is known.
+        """
+        ref = self._origins.get(markup.strip())
+        if ref is not None or not split:
+            return ref
+        parts = split_fragment(f"<template>{markup}</template>")
+        if parts is None or len(parts[1]) < 2:
+            return None
+        refs = [self._origins.get(child) for child in parts[1]]
+        return None if None in refs else refs
+
+    def compact(self, frame: dict) -> dict:
+        """Get ``frame`` with markup replaced by template references where known"""
+        html_updates = {}
+        for element_id, markup in frame.get("html", {}).items():
+            html_updates[element_id] = self.reference(markup) or markup
+
+        patches = {}
+        for element_id, ops in frame.get("patch", {}).items():
+            compacted = []
+            for op in ops:
+                if op[0] != "remove":
+                    ref = self.reference(op[-1], split=True)
+                    if ref is not None:
+                        op = op[:-1] + [ref]
+                compacted.append(op)
+            patches[element_id] = compacted
+
+        if html_updates == frame.get("html", {}) and patches == frame.get("patch", {}):
+            return frame
+        compacted_frame = dict(frame)
+        if html_updates:
+            compacted_frame["html"] = html_updates
+        if patches:
+            compacted_frame["patch"] = patches
+        return compacted_frame
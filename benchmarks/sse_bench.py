@@ -0,0 +1,549 @@
+"""SSE load generator and benchmark for the Python demo apps.
+
+Opens many concurrent SSE subscribers against ``advanced_demo_python/main.py``
+or ``simple_demo_python/demo.py`` while firing a POST workload, then reports
+POST-to-frame delivery latency percentiles, frames/sec, bytes/sec and RSS per
+connection as JSON so results can be compared between commits.
+
+Two transports are available:
+
+* ``asgi`` drives the app in this process through the ASGI interface, with no
+  sockets or HTTP parsing (client and server share one event loop and RSS).
+* ``tcp`` starts the app under uvicorn in a child process and talks HTTP/1.1
+  to it over localhost.
+
+Examples::
+
+    python benchmarks/sse_bench.py --app advanced --subscribers 2000 --duration 20
+    python benchmarks/sse_bench.py --app simple --transport tcp --workload todo=1
+    python benchmarks/sse_bench.py --app advanced --output results/$(git rev-parse --short HEAD).json
+"""
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+import argparse
+import asyncio
+import base64
+import contextlib
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import time
+import zlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+APPS = {
+    "advanced": ("advanced_demo_python", "main"),
+    "simple": ("simple_demo_python", "demo"),
+}
+
+DEFAULT_WORKLOADS = {
+    "advanced": "add_post=4,delete_post=1,generate_posts=0.05",
+    "simple": "todo=1",
+}
+
+# Unique marker embedded in POSTed content; finding it in a frame ends the latency clock
+TOKEN_RE = re.compile(rb"benchpost(\d+)z")
+
+# zlib window bits for the content codings --encoding can ask for
+WBITS = {"gzip": 31, "deflate": 15}
+
+BENCH_PASSWORD = "bench"
+
+
+def load_app(name: str, users: int):
+    """Import a demo app from its directory with stream caps lifted for load"""
+    directory, module_name = APPS[name]
+    app_dir = os.path.join(ROOT, directory)
+    os.chdir(app_dir)
+    sys.path.insert(0, app_dir)
+    module = __import__(module_name)
+
+    from sse import StreamLimiter
+    module.stream_limiter = StreamLimiter(max_streams=10 ** 9, max_per_key=10 ** 9)
+    if hasattr(module, "USERS"):
+        for i in range(users):
+            module.USERS[f"bench{i}"] = BENCH_PASSWORD
+    return module.app
+
+
+def auth_cookie(username: str) -> str:
+    token = base64.b64encode(f"{username}:authenticated".encode()).decode()
+    return f"auth_token={token}"
+
+
+def percentiles(samples: List[float]) -> Dict[str, Optional[float]]:
+    if not samples:
+        return {"count": 0, "p50": None, "p90": None, "p99": None, "max": None, "mean": None}
+    ordered = sorted(samples)
+
+    def pick(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3)
+
+    return {
+        "count": len(ordered),
+        "p50": pick(0.50),
+        "p90": pick(0.90),
+        "p99": pick(0.99),
+        "max": round(ordered[-1] * 1000, 3),
+        "mean": round(sum(ordered) / len(ordered) * 1000, 3),
+    }
+
+
+def read_rss(pid: Optional[int] = None) -> Optional[int]:
+    """Resident set size in bytes of a process (Linux /proc), None if unavailable"""
+    path = f"/proc/{pid or 'self'}/status"
+    try:
+        with open(path) as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class ASGITransport:
+    """Talk to an ASGI app in this process."""
+
+    def __init__(self, app):
+        self._app = app
+        self._lifespan: Optional[asyncio.Task] = None
+        self._lifespan_queue: asyncio.Queue = asyncio.Queue()
+
+    @property
+    def server_pid(self) -> int:
+        return os.getpid()
+
+    async def start(self) -> None:
+        started = asyncio.get_running_loop().create_future()
+
+        async def receive():
+            return await self._lifespan_queue.get()
+
+        async def send(message):
+            if message["type"].startswith("lifespan.startup") and not started.done():
+                started.set_result(message["type"])
+
+        self._lifespan = asyncio.create_task(self._app({"type": "lifespan", "asgi": {"version": "3.0"}}, receive, send))
+        await self._lifespan_queue.put({"type": "lifespan.startup"})
+        await asyncio.wait_for(started, 10)
+
+    async def stop(self) -> None:
+        await self._lifespan_queue.put({"type": "lifespan.shutdown"})
+        with contextlib.suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(self._lifespan, 5)
+
+    def _scope(self, method: str, path: str, headers: List[Tuple[str, str]], client: str) -> dict:
+        path, _, query = path.partition("?")
+        return {
+            "type": "http",
+            "asgi": {"version": "3.0", "spec_version": "2.3"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": query.encode(),
+            "root_path": "",
+            "headers": [(k.lower().encode(), v.encode()) for k, v in headers],
+            "client": (client, 50000),
+            "server": ("127.0.0.1", 80),
+        }
+
+    async def request(self, method: str, path: str, headers: List[Tuple[str, str]], body: bytes = b"") -> int:
+        status = 0
+        sent = False
+
+        async def receive():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            await asyncio.Event().wait()
+
+        async def send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+
+        await self._app(self._scope(method, path, headers, "127.0.0.1"), receive, send)
+        return status
+
+    async def stream(
+        self,
+        path: str,
+        headers: List[Tuple[str, str]],
+        on_chunk: Callable[[bytes], None],
+        stop: asyncio.Event,
+        client: str,
+    ) -> int:
+        status = 0
+        sent = False
+
+        async def receive():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            await stop.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                on_chunk(message.get("body", b""))
+
+        app_task = asyncio.create_task(self._app(self._scope("GET", path, headers, client), receive, send))
+        await stop.wait()
+        # Give the response a moment to notice the disconnect, then cancel it
+        with contextlib.suppress(asyncio.TimeoutError, asyncio.CancelledError, Exception):
+            await asyncio.wait_for(app_task, 1)
+        return status
+
+
+class TCPTransport:
+    """Talk HTTP/1.1 to the app served by uvicorn in a child process."""
+
+    def __init__(self, app_name: str, users: int, port: int):
+        self._app_name = app_name
+        self._users = users
+        self._port = port
+        self._process: Optional[subprocess.Popen] = None
+
+    @property
+    def server_pid(self) -> Optional[int]:
+        return self._process.pid if self._process else None
+
+    async def start(self) -> None:
+        self._process = subprocess.Popen([
+            sys.executable, os.path.abspath(__file__), "--serve",
+            "--app", self._app_name, "--users", str(self._users), "--port", str(self._port),
+        ], stdout=subprocess.DEVNULL)
+        deadline = time.monotonic() + 15
+        while time.monotonic() < deadline:
+            try:
+                _, writer = await asyncio.open_connection("127.0.0.1", self._port)
+                writer.close()
+                return
+            except OSError:
+                await asyncio.sleep(0.1)
+        raise RuntimeError("server did not start")
+
+    async def stop(self) -> None:
+        if self._process is not None:
+            self._process.terminate()
+            self._process.wait(10)
+
+    async def _send_request(self, method: str, path: str, headers: List[Tuple[str, str]], body: bytes):
+        reader, writer = await asyncio.open_connection("127.0.0.1", self._port)
+        lines = [f"{method} {path} HTTP/1.1", f"Host: 127.0.0.1:{self._port}", f"Content-Length: {len(body)}"]
+        lines += [f"{k}: {v}" for k, v in headers]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + body)
+        await writer.drain()
+
+        status_line = await reader.readline()
+        status = int(status_line.split()[1]) if status_line else 0
+        response_headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            key, _, value = line.decode().partition(":")
+            response_headers[key.strip().lower()] = value.strip()
+        return reader, writer, status, response_headers
+
+    async def request(self, method: str, path: str, headers: List[Tuple[str, str]], body: bytes = b"") -> int:
+        reader, writer, status, response_headers = await self._send_request(
+            method, path, headers + [("Connection", "close")], body
+        )
+        with contextlib.suppress(Exception):
+            await reader.read()
+        writer.close()
+        return status
+
+    async def stream(
+        self,
+        path: str,
+        headers: List[Tuple[str, str]],
+        on_chunk: Callable[[bytes], None],
+        stop: asyncio.Event,
+        client: str,
+    ) -> int:
+        reader, writer, status, response_headers = await self._send_request("GET", path, headers, b"")
+
+        async def pump():
+            chunked = response_headers.get("transfer-encoding") == "chunked"
+            while True:
+                if chunked:
+                    size_line = await reader.readline()
+                    if not size_line:
+                        return
+                    size = int(size_line.strip() or b"0", 16)
+                    if size == 0:
+                        return
+                    data = await reader.readexactly(size + 2)
+                    on_chunk(data[:-2])
+                else:
+                    data = await reader.read(65536)
+                    if not data:
+                        return
+                    on_chunk(data)
+
+        pump_task = asyncio.create_task(pump())
+        await stop.wait()
+        pump_task.cancel()
+        writer.close()
+        return status
+
+
+class Benchmark:
+    def __init__(self, args, transport):
+        self.args = args
+        self.transport = transport
+        self.workload = self._parse_workload(args.workload or DEFAULT_WORKLOADS[args.app])
+        self.sent_at: Dict[int, float] = {}
+        self.latencies: List[float] = []
+        self.frames = 0
+        self.bytes = 0
+        self.decoded_bytes = 0
+        self.deleted: Dict[str, int] = {}
+        self.statuses: Dict[str, Dict[int, int]] = {}
+        self.stream_statuses: Dict[int, int] = {}
+        self.measuring = False
+        self._next_token = 0
+
+    @staticmethod
+    def _parse_workload(spec: str) -> Dict[str, float]:
+        workload = {}
+        for part in spec.split(","):
+            name, _, weight = part.partition("=")
+            workload[name.strip()] = float(weight or 1)
+        return workload
+
+    def username(self, index: int) -> str:
+        return f"bench{index % self.args.users}"
+
+    def headers_for(self, username: Optional[str]) -> List[Tuple[str, str]]:
+        return [("Cookie", auth_cookie(username))] if username else []
+
+    def stream_headers(self, username: Optional[str]) -> List[Tuple[str, str]]:
+        headers = self.headers_for(username)
+        if self.args.encoding:
+            headers.append(("Accept-Encoding", self.args.encoding))
+        return headers
+
+    def _token(self) -> str:
+        self._next_token += 1
+        self.sent_at[self._next_token] = time.perf_counter()
+        return f"benchpost{self._next_token}z"
+
+    def subscriber_callback(self) -> Callable[[bytes], None]:
+        seen = 0
+        # Streams are compressed as one context per connection, so decode them in order
+        decoder = zlib.decompressobj(WBITS[self.args.encoding]) if self.args.encoding else None
+
+        def on_chunk(data: bytes) -> None:
+            nonlocal seen
+            wire_bytes = len(data)
+            if decoder is not None:
+                data = decoder.decompress(data)
+            if not self.measuring:
+                return
+            now = time.perf_counter()
+            self.frames += data.count(b"data:")
+            self.bytes += wire_bytes
+            self.decoded_bytes += len(data)
+            for match in TOKEN_RE.finditer(data):
+                token = int(match.group(1))
+                # The same post keeps appearing in later snapshots, only time its first sighting
+                if token > seen:
+                    seen = token
+                    sent = self.sent_at.get(token)
+                    if sent is not None:
+                        self.latencies.append(now - sent)
+
+        return on_chunk
+
+    async def login_users(self) -> None:
+        if self.args.app != "advanced":
+            return
+        for i in range(self.args.users):
+            body = urlencode({"username": f"bench{i}", "password": BENCH_PASSWORD}).encode()
+            await self.transport.request(
+                "POST", "/login", [("Content-Type", "application/x-www-form-urlencoded")], body
+            )
+
+    def stream_path(self, index: int) -> Tuple[str, Optional[str]]:
+        if self.args.app == "advanced":
+            username = self.username(index)
+            return f"/stream/{username}", username
+        return "/website-logic", None
+
+    async def post(self, operation: str) -> None:
+        username = self.username(random.randrange(self.args.users)) if self.args.app == "advanced" else None
+        form: Dict[str, str] = {}
+        if operation == "add_post":
+            form["post_content"] = self._token()
+        elif operation == "delete_post":
+            # Post ids count up from 1 per user; delete the oldest in order
+            self.deleted[username] = self.deleted.get(username, 0) + 1
+            form["post_id"] = str(self.deleted[username])
+        elif operation == "todo":
+            form["todo_text"] = self._token()
+        body = urlencode(form).encode()
+        headers = self.headers_for(username) + [("Content-Type", "application/x-www-form-urlencoded")]
+        status = await self.transport.request("POST", f"/{operation}", headers, body)
+        counts = self.statuses.setdefault(operation, {})
+        counts[status] = counts.get(status, 0) + 1
+
+    async def drive_posts(self, stop: asyncio.Event) -> None:
+        operations = list(self.workload)
+        weights = [self.workload[name] for name in operations]
+        interval = 1 / self.args.rate
+        tasks = set()
+        while not stop.is_set():
+            task = asyncio.create_task(self.post(random.choices(operations, weights)[0]))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            await asyncio.sleep(interval)
+        if tasks:
+            await asyncio.wait(tasks, timeout=10)
+
+    async def run(self) -> dict:
+        await self.transport.start()
+        try:
+            await self.login_users()
+            rss_before = read_rss(self.transport.server_pid)
+
+            stop = asyncio.Event()
+            streams = []
+            for i in range(self.args.subscribers):
+                path, username = self.stream_path(i)
+                client = f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}"
+                streams.append(asyncio.create_task(self.transport.stream(
+                    path, self.stream_headers(username), self.subscriber_callback(), stop, client
+                )))
+                if i % 200 == 199:
+                    await asyncio.sleep(0)
+
+            await asyncio.sleep(self.args.warmup)
+            rss_connected = read_rss(self.transport.server_pid)
+
+            self.measuring = True
+            started = time.perf_counter()
+            post_stop = asyncio.Event()
+            driver = asyncio.create_task(self.drive_posts(post_stop))
+            await asyncio.sleep(self.args.duration)
+            post_stop.set()
+            await driver
+            elapsed = time.perf_counter() - started
+            self.measuring = False
+
+            stop.set()
+            for status in await asyncio.gather(*streams, return_exceptions=True):
+                key = status if isinstance(status, int) else -1
+                self.stream_statuses[key] = self.stream_statuses.get(key, 0) + 1
+        finally:
+            await self.transport.stop()
+
+        rss_per_connection = None
+        if rss_before is not None and rss_connected is not None and self.args.subscribers:
+            rss_per_connection = round((rss_connected - rss_before) / self.args.subscribers)
+
+        return {
+            "commit": git_commit(),
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "config": {
+                "app": self.args.app,
+                "transport": self.args.transport,
+                "subscribers": self.args.subscribers,
+                "users": self.args.users,
+                "duration": self.args.duration,
+                "rate": self.args.rate,
+                "encoding": self.args.encoding,
+                "workload": self.workload,
+            },
+            "results": {
+                "elapsed": round(elapsed, 3),
+                "latency_ms": percentiles(self.latencies),
+                "frames": self.frames,
+                "frames_per_sec": round(self.frames / elapsed, 1),
+                "bytes": self.bytes,
+                "bytes_per_sec": round(self.bytes / elapsed, 1),
+                "decoded_bytes": self.decoded_bytes,
+                "rss_before": rss_before,
+                "rss_connected": rss_connected,
+                "rss_per_connection": rss_per_connection,
+                "rss_scope": "process" if self.args.transport == "asgi" else "server",
+                "post_statuses": self.statuses,
+                "stream_statuses": self.stream_statuses,
+            },
+        }
+
+
+def serve(args) -> None:
+    import uvicorn
+
+    app = load_app(args.app, args.users)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--app", choices=sorted(APPS), default="advanced")
+    parser.add_argument("--transport", choices=("asgi", "tcp"), default="asgi")
+    parser.add_argument("--subscribers", type=int, default=1000, help="concurrent SSE connections")
+    parser.add_argument("--users", type=int, default=100, help="bench users the subscribers are spread over (advanced app)")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of POST load to measure")
+    parser.add_argument("--warmup", type=float, default=2.0, help="seconds to let subscribers connect")
+    parser.add_argument("--rate", type=float, default=50.0, help="POSTs per second")
+    parser.add_argument("--workload", help="weighted POST mix, e.g. add_post=4,delete_post=1")
+    parser.add_argument("--encoding", choices=sorted(WBITS), help="ask for compressed streams; bytes are counted on the wire")
+    parser.add_argument("--port", type=int, default=8765, help="port for --transport tcp")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON results to this file")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    # load_app() changes into the app directory, resolve the output path first
+    output_path = os.path.abspath(args.output) if args.output else None
+    random.seed(args.seed)
+    if args.transport == "asgi":
+        transport = ASGITransport(load_app(args.app, args.users))
+    else:
+        transport = TCPTransport(args.app, args.users, args.port)
+
+    # Keep the apps' own prints out of the JSON on stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        results = asyncio.run(Benchmark(args, transport).run())
+    output = json.dumps(results, indent=2)
+    if output_path:
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        with open(output_path, "w") as f:
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
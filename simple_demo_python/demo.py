@@ -1,18 +1,116 @@
-from fastapi import FastAPI, Form
-from fastapi.responses import HTMLResponse, StreamingResponse
+from fastapi import FastAPI, Form, Request
+from fastapi.responses import HTMLResponse
 from fastapi.staticfiles import StaticFiles
+from functools import lru_cache
+from typing import List, Optional, Set, Tuple
 import asyncio
 import json
+import os
+import sqlite3
 import time
 import random
+from sse import EventStreamResponse, StreamLimiter, STREAM_ENCODINGS
+from persistence import WriteBehindStore
 
 app = FastAPI()
 
 # Serve static files (for ssexi.js)
 app.mount("/static", StaticFiles(directory="."), name="static")
 
-# Store todos in memory
-todos = []
+class TodoStore:
+    """Todos kept in memory (single worker)."""
+
+    def __init__(self):
+        self._todos: List[str] = []
+
+    def add(self, text: str) -> None:
+        self._todos.append(text)
+
+    def version(self) -> int:
+        """Changes whenever a todo is added"""
+        return len(self._todos)
+
+    def all(self) -> List[str]:
+        return list(self._todos)
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+class PersistentTodoStore(TodoStore):
+    """Todos kept in memory and persisted write-behind (single worker).
+
+    Saved todos are loaded the first time they are needed, not at startup.
+    """
+
+    def __init__(self, store: WriteBehindStore):
+        super().__init__()
+        self._store = store
+        self._loaded = False
+
+    def add(self, text: str) -> None:
+        self._load()
+        self._store.put(f"todo:{len(self._todos):010d}", text)
+        super().add(text)
+
+    def version(self) -> int:
+        self._load()
+        return super().version()
+
+    def all(self) -> List[str]:
+        self._load()
+        return super().all()
+
+    async def start(self) -> None:
+        await self._store.start()
+
+    async def stop(self) -> None:
+        await self._store.stop()
+
+    def _load(self) -> None:
+        if not self._loaded:
+            self._loaded = True
+            self._todos = [text for _, text in self._store.scan("todo:")]
+
+class SQLiteTodoStore(TodoStore):
+    """Todos shared by every worker through a SQLite WAL database."""
+
+    def __init__(self, path: str):
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA busy_timeout=5000")
+        self._db.execute("CREATE TABLE IF NOT EXISTS todos (id INTEGER PRIMARY KEY AUTOINCREMENT, text TEXT NOT NULL)")
+
+    def add(self, text: str) -> None:
+        self._db.execute("INSERT INTO todos (text) VALUES (?)", (text,))
+
+    def version(self) -> int:
+        return self._db.execute("SELECT COALESCE(MAX(id), 0) FROM todos").fetchone()[0]
+
+    def all(self) -> List[str]:
+        return [row[0] for row in self._db.execute("SELECT text FROM todos ORDER BY id")]
+
+# Store todos in memory, or set SSEXI_TODO_DB to a SQLite path to share them
+# between workers (uvicorn demo:app --workers N), or SSEXI_TODO_STORE to
+# persist a single worker's todos write-behind
+TODO_DB = os.environ.get("SSEXI_TODO_DB")
+TODO_STORE = os.environ.get("SSEXI_TODO_STORE")
+if TODO_DB:
+    todos = SQLiteTodoStore(TODO_DB)
+elif TODO_STORE:
+    todos = PersistentTodoStore(WriteBehindStore(TODO_STORE))
+else:
+    todos = TodoStore()
+
+@app.on_event("startup")
+async def startup_event():
+    await todos.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await todos.stop()
 
 @app.get("/", response_class=HTMLResponse)
 async def home():
@@ -20,89 +118,153 @@ async def home():
     with open("index.html", "r") as f:
         return HTMLResponse(f.read())
 
+def encode_frame(update: dict) -> bytes:
+    """Encode an SSEXI update as an SSE data message"""
+    return f"data: {json.dumps(update)}\n\n".encode()
+
+COLORS = ["lightblue", "lightgreen", "lightcoral", "wheat"]
+
+# Background colour frames are the same for every client, encode them once
+COLOR_FRAMES = [
+    encode_frame({"js": {"exec": f"document.body.style.backgroundColor = '{color}';"}})
+    for color in COLORS
+]
+
+@lru_cache(maxsize=4096)
+def count_frames(count: int) -> Tuple[bytes, bytes]:
+    """Per-client counter frames, shared by every client at the same count"""
+    counter_frame = encode_frame({"html": {"counter": f'<div id="counter">Count: {count}</div>'}})
+
+    # Every 5 counts, set a JS variable and execute some code
+    milestone_frames = b""
+    if count % 5 == 0:
+        milestone_frames += encode_frame({"js": {"counterValue": count}})
+        milestone_frames += encode_frame({"js": {"exec": f"console.log('Counter reached {count}!');"}})
+    return counter_frame, milestone_frames
+
+class Ticker:
+    """Single background producer shared by every /website-logic stream.
+
+    Each tick the timestamp and todos frames are built and encoded once and
+    handed to every subscriber; only the counter, which starts at each
+    client's connection, is per-subscriber state.
+    """
+
+    def __init__(self, interval: float = 1.0):
+        self._interval = interval
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._latest: Optional[Tuple[bytes, bytes]] = None
+        self._todos_version = -1
+        self._todos_frame = b""
+
+    def subscribe(self) -> asyncio.Queue:
+        """Get a queue of (timestamp, todos) frames, starting with the latest tick"""
+        queue = asyncio.Queue(maxsize=2)
+        if self._latest is not None:
+            queue.put_nowait(self._latest)
+        self._subscribers.add(queue)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self._subscribers.discard(queue)
+        if not self._subscribers and self._task is not None:
+            self._task.cancel()
+            self._task = None
+            self._latest = None
+
+    def _todos(self) -> bytes:
+        # Only re-render when a todo was added, possibly by another worker
+        version = todos.version()
+        if version != self._todos_version:
+            todos_html = ''.join(f'<li>{todo}</li>' for todo in todos.all())
+            self._todos_frame = encode_frame({"html": {"todos": f'<ul id="todos">{todos_html}</ul>'}})
+            self._todos_version = version
+        return self._todos_frame
+
+    async def _run(self) -> None:
+        while True:
+            timestamp = int(time.time())
+            timestamp_frame = encode_frame({
+                "html": {
+                    "timestamp": f'<div id="timestamp">Current Time: {timestamp}</div>'
+                }
+            })
+            self._latest = (timestamp_frame, self._todos())
+
+            for queue in self._subscribers:
+                # A client that can't keep up only needs the newest tick
+                if queue.full():
+                    queue.get_nowait()
+                queue.put_nowait(self._latest)
+
+            await asyncio.sleep(self._interval)
+
+ticker = Ticker()
+
+# Open SSE streams, capped globally and per client address
+MAX_STREAMS = 10_000
+MAX_STREAMS_PER_CLIENT = 16
+stream_limiter = StreamLimiter(MAX_STREAMS, MAX_STREAMS_PER_CLIENT)
+
+# Behind a reverse proxy every stream comes from the proxy's address and the
+# per-client cap becomes global. Set SSEXI_TRUST_FORWARDED=1 there to count
+# streams per X-Forwarded-For client instead; only do so when the proxy sets
+# the header, or clients can pick their own address
+TRUST_FORWARDED = os.environ.get("SSEXI_TRUST_FORWARDED") == "1"
+
+def client_address(request: Request) -> str:
+    """Address a client's streams are counted against"""
+    if TRUST_FORWARDED:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            # Our proxy appends the address it saw; earlier entries came from the client
+            return forwarded.rsplit(",", 1)[-1].strip()
+    return request.client.host if request.client else ""
+
+# Compress streams for clients that accept it (brotli when installed, else gzip/deflate)
+STREAM_COMPRESSION = True
+
 @app.get("/website-logic")
-async def website_logic():
+async def website_logic(request: Request):
     """Single SSE endpoint that handles all website logic"""
+    client = client_address(request)
+    if not stream_limiter.acquire(client):
+        return stream_limiter.reject()
+
+    queue = ticker.subscribe()
+
     async def event_generator():
-        try:
-            count = 0
-            while True:
-                count += 1
-                timestamp = int(time.time())
-                
-                # Update timestamp
-                timestamp_update = {
-                    "html": {
-                        "timestamp": f'<div id="timestamp">Current Time: {timestamp}</div>'
-                    }
-                }
-                yield f"data: {json.dumps(timestamp_update)}\n\n"
-                
-                # Update counter
-                counter_update = {
-                    "html": {
-                        "counter": f'<div id="counter">Count: {count}</div>'
-                    }
-                }
-                yield f"data: {json.dumps(counter_update)}\n\n"
-                
-                # Update todos list
-                todos_html = ''.join(f'<li>{todo}</li>' for todo in todos)
-                todos_update = {
-                    "html": {
-                        "todos": f'<ul id="todos">{todos_html}</ul>'
-                    }
-                }
-                yield f"data: {json.dumps(todos_update)}\n\n"
-                
-                # Every 5 counts, set a JS variable and execute some code
-                if count % 5 == 0:
-                    js_var_update = {
-                        "js": {
-                            "counterValue": count
-                        }
-                    }
-                    yield f"data: {json.dumps(js_var_update)}\n\n"
-                    
-                    js_exec_update = {
-                        "js": {
-                            "exec": f"console.log('Counter reached {count}!');"
-                        }
-                    }
-                    yield f"data: {json.dumps(js_exec_update)}\n\n"
-                
-                # Every 10 counts, change background color
-                if count % 10 == 0:
-                    colors = ["lightblue", "lightgreen", "lightcoral", "wheat"]
-                    color = random.choice(colors)
-                    
-                    color_update = {
-                        "js": {
-                            "exec": f"document.body.style.backgroundColor = '{color}';"
-                        }
-                    }
-                    yield f"data: {json.dumps(color_update)}\n\n"
-                
-                await asyncio.sleep(1)
-                
-        except asyncio.CancelledError:
-            pass
-    
-    return StreamingResponse(
+        count = 0
+        while True:
+            timestamp_frame, todos_frame = await queue.get()
+            count += 1
+
+            counter_frame, milestone_frames = count_frames(count)
+            frames = timestamp_frame + counter_frame + todos_frame + milestone_frames
+
+            # Every 10 counts, change background color
+            if count % 10 == 0:
+                frames += random.choice(COLOR_FRAMES)
+
+            yield frames
+
+    return EventStreamResponse(
+        request,
         event_generator(),
-        media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "Transfer-Encoding": "chunked"
-        }
+        on_close=lambda: ticker.unsubscribe(queue),
+        limiter=stream_limiter,
+        key=client,
+        encodings=STREAM_ENCODINGS if STREAM_COMPRESSION else (),
     )
 
 @app.post("/todo")
 async def add_todo(todo_text: str = Form(...)):
     """Add a new todo item and send form reset via SSE"""
     print(f"Received todo: {todo_text}")  # Print to console as requested
-    todos.append(todo_text)
+    todos.add(todo_text)
     
     # Since we can't send SSE directly from POST, we'll use a different approach
     # The SSE stream will pick up the updated todos automatically
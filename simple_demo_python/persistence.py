@@ -0,0 +1,157 @@
+from typing import Callable, Dict, List, Optional, Tuple, Union
+import asyncio
+import sqlite3
+
+# A record value, or a callable producing it when the record is flushed
+Value = Union[str, Callable[[], str]]
+
+
+def _resolve(value: Optional[Value]) -> Optional[str]:
+    return value() if callable(value) else value
+
+
+class WriteBehindStore:
+    """Durable key/value records written behind the request path.
+
+    ``put`` and ``delete`` only record the change in memory (the last write
+    to a key wins). A background task commits the pending changes to a
+    SQLite WAL database in one transaction every ``flush_interval`` seconds,
+    or as soon as ``max_pending`` keys are waiting, and does so in a worker
+    thread so handlers never wait on disk. Reads see pending writes first.
+    A value may be given as a callable, so a record saved many times within
+    one interval is only serialized once, when it is flushed.
+
+    Nothing is loaded at startup; callers hydrate records lazily with
+    ``get``/``scan`` when they are first needed. A crash loses at most the
+    writes of the last flush interval.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 0.05, max_pending: int = 256):
+        self._path = path
+        self._flush_interval = flush_interval
+        self._max_pending = max_pending
+        # None marks a deleted key
+        self._pending: Dict[str, Optional[Value]] = {}
+        self._flushing: Dict[str, Optional[str]] = {}
+        self._reader: Optional[sqlite3.Connection] = None
+        self._writer: Optional[sqlite3.Connection] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+        self._flush_lock = asyncio.Lock()
+        self.flushes = 0
+
+    @property
+    def pending_count(self) -> int:
+        """Number of changed keys not yet committed"""
+        return len(self._pending) + len(self._flushing)
+
+    async def start(self) -> None:
+        self._writer = self._connect()
+        self._writer.execute("PRAGMA journal_mode=WAL")
+        self._writer.execute("PRAGMA synchronous=NORMAL")
+        self._writer.execute(
+            "CREATE TABLE IF NOT EXISTS records (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+        )
+        self._reader = self._connect()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._flusher = asyncio.create_task(self._run_flusher())
+
+    async def stop(self) -> None:
+        """Stop the flusher and commit everything still pending"""
+        if self._flusher is not None:
+            # Let the flusher finish its commit rather than cancel it mid-transaction
+            self._stopping = True
+            self._wakeup.set()
+            await self._flusher
+            self._flusher = None
+        for db in (self._reader, self._writer):
+            if db is not None:
+                db.close()
+        self._reader = self._writer = None
+
+    def get(self, key: str) -> Optional[str]:
+        for changes in (self._pending, self._flushing):
+            if key in changes:
+                return _resolve(changes[key])
+        row = self._reader.execute("SELECT value FROM records WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def scan(self, prefix: str) -> List[Tuple[str, str]]:
+        """Get every record whose key starts with ``prefix``, ordered by key"""
+        rows = dict(self._reader.execute(
+            "SELECT key, value FROM records WHERE key >= ? AND key < ?",
+            (prefix, prefix + "\uffff"),
+        ).fetchall())
+        for changes in (self._flushing, self._pending):
+            for key, value in changes.items():
+                if key.startswith(prefix):
+                    rows[key] = _resolve(value)
+        return sorted((key, value) for key, value in rows.items() if value is not None)
+
+    def put(self, key: str, value: Value) -> None:
+        self._change(key, value)
+
+    def delete(self, key: str) -> None:
+        self._change(key, None)
+
+    async def flush(self) -> None:
+        """Commit pending changes now"""
+        async with self._flush_lock:
+            if not self._pending or self._writer is None:
+                return
+            self._flushing, self._pending = self._pending, {}
+            try:
+                batch = {key: _resolve(value) for key, value in self._flushing.items()}
+                await asyncio.to_thread(self._commit, batch)
+                self.flushes += 1
+            except sqlite3.Error:
+                # Keep the batch for the next flush unless newer writes replaced it
+                self._pending = {**self._flushing, **self._pending}
+                raise
+            finally:
+                self._flushing = {}
+
+    def _change(self, key: str, value: Optional[Value]) -> None:
+        self._pending.pop(key, None)
+        self._pending[key] = value
+        if len(self._pending) >= self._max_pending and self._wakeup is not None:
+            self._wakeup.set()
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self._path, isolation_level=None, check_same_thread=False)
+        db.execute("PRAGMA busy_timeout=5000")
+        return db
+
+    def _commit(self, changes: Dict[str, Optional[str]]) -> None:
+        db = self._writer
+        db.execute("BEGIN")
+        try:
+            db.executemany(
+                "INSERT INTO records (key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                [(key, value) for key, value in changes.items() if value is not None],
+            )
+            db.executemany(
+                "DELETE FROM records WHERE key = ?",
+                [(key,) for key, value in changes.items() if value is None],
+            )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    async def _run_flusher(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self._flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except sqlite3.Error:
+                # Retried with the next batch
+                pass
+        await self.flush()
@@ -0,0 +1,220 @@
+from typing import AsyncIterable, Callable, Dict, Optional, Sequence
+import asyncio
+import zlib
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "Transfer-Encoding": "chunked",
+    # Stop nginx-style proxies from buffering the stream
+    "X-Accel-Buffering": "no",
+}
+
+HEARTBEAT = b":\n\n"
+
+# Content codings EventStreamResponse can stream, in order of preference
+STREAM_ENCODINGS = ("br", "gzip", "deflate") if brotli is not None else ("gzip", "deflate")
+
+# zlib settings per connection; each compressor holds about
+# 2 ** (ZLIB_WBITS + 2) + 2 ** (ZLIB_MEM_LEVEL + 9) bytes for the stream's life
+ZLIB_LEVEL = 6
+ZLIB_WBITS = 15
+ZLIB_MEM_LEVEL = 7
+BROTLI_QUALITY = 5
+
+
+def negotiate_encoding(accept_encoding: str, encodings: Sequence[str]) -> Optional[str]:
+    """Pick the first of ``encodings`` the ``Accept-Encoding`` header allows"""
+    accepted: Dict[str, float] = {}
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if coding:
+            accepted[coding] = quality
+
+    for encoding in encodings:
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > 0:
+            return encoding
+    return None
+
+
+class StreamCompressor:
+    """Compression context kept for the whole life of one stream.
+
+    Every chunk is flushed as soon as it is compressed, so the client can
+    decode each frame right away while later frames still benefit from the
+    markup already seen on the connection.
+    """
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=BROTLI_QUALITY)
+            self._zlib = None
+        else:
+            # 16 + wbits writes a gzip container, plain wbits a zlib one ("deflate")
+            wbits = ZLIB_WBITS + 16 if encoding == "gzip" else ZLIB_WBITS
+            self._zlib = zlib.compressobj(ZLIB_LEVEL, zlib.DEFLATED, wbits, ZLIB_MEM_LEVEL)
+            self._brotli = None
+
+    def compress(self, data: bytes) -> bytes:
+        if self._zlib is not None:
+            return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+        return self._brotli.process(data) + self._brotli.flush()
+
+    def finish(self) -> bytes:
+        if self._zlib is not None:
+            return self._zlib.flush(zlib.Z_FINISH)
+        return self._brotli.finish()
+
+
+class StreamLimiter:
+    """Caps on concurrently open SSE streams, globally and per key (e.g. user)."""
+
+    def __init__(self, max_streams: int = 10_000, max_per_key: int = 8, retry_after: int = 5):
+        self._max_streams = max_streams
+        self._max_per_key = max_per_key
+        self._retry_after = retry_after
+        self._active = 0
+        self._per_key: Dict[str, int] = {}
+        self.rejected = 0
+
+    @property
+    def active(self) -> int:
+        """Number of streams currently open"""
+        return self._active
+
+    def count(self, key: str) -> int:
+        return self._per_key.get(key, 0)
+
+    def acquire(self, key: str) -> bool:
+        """Reserve a stream slot for ``key``, returns False when a cap is reached"""
+        if self._active >= self._max_streams or self.count(key) >= self._max_per_key:
+            self.rejected += 1
+            return False
+        self._active += 1
+        self._per_key[key] = self.count(key) + 1
+        return True
+
+    def release(self, key: str) -> None:
+        remaining = self.count(key) - 1
+        if remaining > 0:
+            self._per_key[key] = remaining
+        else:
+            self._per_key.pop(key, None)
+        self._active -= 1
+
+    def reject(self) -> Response:
+        """Response for a stream refused because a cap was reached"""
+        return Response(
+            "Too many open streams",
+            status_code=503,
+            headers={"Retry-After": str(self._retry_after)},
+        )
+
+
+class EventStreamResponse(StreamingResponse):
+    """SSE response that notices dead clients and always cleans up.
+
+    Sends a ``retry:`` hint first, then the encoded frames. When no frame
+    arrives for ``heartbeat`` seconds it checks ``request.is_disconnected()``
+    and either ends the stream or writes a ``:`` comment to keep proxies and
+    the client's connection alive. ``on_close`` runs and the limiter slot
+    for ``key`` is released however the response ends, even if the body was
+    never started.
+
+    With ``encodings``, the stream is compressed with the first of them the
+    client accepts. The choice is made once per connection, so streams whose
+    frames are expected to stay under ``min_size`` bytes (``size_hint``) are
+    sent as-is; without a hint they are compressed.
+    """
+
+    def __init__(
+        self,
+        request: Request,
+        frames: AsyncIterable[bytes],
+        heartbeat: float = 15.0,
+        retry: Optional[int] = 5000,
+        on_close: Optional[Callable[[], None]] = None,
+        limiter: Optional[StreamLimiter] = None,
+        key: str = "",
+        encodings: Sequence[str] = (),
+        min_size: int = 0,
+        size_hint: Optional[int] = None,
+    ):
+        self._request = request
+        self._frames = frames
+        self._heartbeat = heartbeat
+        self._retry = retry
+        self._on_close = on_close
+        self._limiter = limiter
+        self._key = key
+        self._compressor: Optional[StreamCompressor] = None
+        headers = dict(SSE_HEADERS)
+        if encodings:
+            headers["Vary"] = "Accept-Encoding"
+            encoding = negotiate_encoding(request.headers.get("accept-encoding", ""), encodings)
+            if encoding is not None and (size_hint is None or size_hint >= min_size):
+                self._compressor = StreamCompressor(encoding)
+                headers["Content-Encoding"] = encoding
+        body = self._events() if self._compressor is None else self._compressed()
+        super().__init__(body, media_type="text/event-stream", headers=headers)
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            if self._on_close is not None:
+                self._on_close()
+            if self._limiter is not None:
+                self._limiter.release(self._key)
+
+    async def _compressed(self):
+        compressor = self._compressor
+        async for chunk in self._events():
+            yield compressor.compress(chunk)
+        yield compressor.finish()
+
+    async def _events(self):
+        if self._retry is not None:
+            yield f"retry: {self._retry}\n\n".encode()
+
+        frames = self._frames.__aiter__()
+        pending: Optional[asyncio.Future] = None
+        try:
+            while True:
+                if pending is None:
+                    pending = asyncio.ensure_future(frames.__anext__())
+                done, _ = await asyncio.wait((pending,), timeout=self._heartbeat)
+                if not done:
+                    if await self._request.is_disconnected():
+                        break
+                    yield HEARTBEAT
+                    continue
+
+                next_frame, pending = pending, None
+                try:
+                    data = next_frame.result()
+                except StopAsyncIteration:
+                    break
+                yield data
+        except asyncio.CancelledError:
+            # Handle disconnection
+            pass
+        finally:
+            if pending is not None:
+                pending.cancel()
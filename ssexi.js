@@ -8,8 +8,10 @@
     // Mutation observer to watch for new elements
     document.__ssexi_mo = new MutationObserver((recs) => 
         recs.forEach((r) => 
-            r.type === "childList" && 
-            r.addedNodes.forEach((n) => process(n))
+            r.type === "childList" && (
+                r.removedNodes.forEach((n) => cleanup(n)),
+                r.addedNodes.forEach((n) => process(n))
+            )
         )
     );
     
@@ -31,6 +33,26 @@
     // SSE connection management
     let connections = new Map();
     
+    // Fragment templates the server may reference instead of sending markup,
+    // kept across page loads so they are only sent again when they change
+    let templates = { version: null, templates: {} };
+    try {
+        templates = JSON.parse(localStorage.getItem("sx-templates")) || templates;
+    } catch (e) {}
+    
+    // Ask for template references, telling the server which version we hold
+    let withTemplates = (url) =>
+        url + (url.includes("?") ? "&" : "?") + "templates=" + encodeURIComponent(templates.version || "none");
+    
+    let escapeHtml = (value) => String(value).replace(/[&<>"']/g, (c) =>
+        ({ "&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "'": "&#x27;" })[c]);
+    
+    // Markup, or {tpl, params} references (one or a list) to expand into it
+    let expand = (content) => typeof content === "string" ? content :
+        [].concat(content).map(({ tpl, params }) =>
+            templates.templates[tpl].replace(/\{\{(\w+)\}\}/g, (m, key) => escapeHtml(params[key]))
+        ).join("");
+    
     // Initialize form handling for element
     let initForm = (elt) => {
         if (elt.__ssexi_form || ignore(elt) || !send(elt, "form-init", {})) return;
@@ -75,6 +97,116 @@
         send(elt, "form-initialized", { endpoint: postEndpoint });
     };
 
+    // Apply one SSEXI frame (html, patch, then js) to the page
+    let applyUpdate = (elt, update, endpoint) => {
+        if (!send(elt, "message", { update, endpoint })) return;
+        
+        // Template definitions come before any frame referencing them
+        if (update.templates) {
+            templates = update.templates;
+            try {
+                localStorage.setItem("sx-templates", JSON.stringify(templates));
+            } catch (e) {}
+            send(elt, "templates", { version: templates.version });
+        }
+        
+        // Handle HTML updates
+        if (update.html) {
+            Object.entries(update.html).forEach(([elementId, htmlContent]) => {
+                const targetElement = document.getElementById(elementId);
+                if (targetElement) {
+                    const doUpdate = () => {
+                        const temp = document.createElement('div');
+                        temp.innerHTML = expand(htmlContent);
+                        const newElement = temp.querySelector(targetElement.tagName);
+                        
+                        if (newElement) {
+                            // Clear existing content
+                            while (targetElement.firstChild) {
+                                targetElement.removeChild(targetElement.firstChild);
+                            }
+                            
+                            // Move new content
+                            while (newElement.firstChild) {
+                                targetElement.appendChild(newElement.firstChild);
+                            }
+                            
+                            // Preserve ID and update other attributes
+                            const originalId = targetElement.id;
+                            while (targetElement.attributes.length > 0) {
+                                targetElement.removeAttribute(targetElement.attributes[0].name);
+                            }
+                            targetElement.id = originalId;
+                            
+                            Array.from(newElement.attributes).forEach(attr => {
+                                if (attr.name !== 'id') {
+                                    targetElement.setAttribute(attr.name, attr.value);
+                                }
+                            });
+                            
+                            send(elt, "html-updated", { elementId, targetElement });
+                        }
+                    };
+                    
+                    // Simple update without view transitions
+                    doUpdate();
+                } else {
+                    send(elt, "html-error", { elementId, error: "Element not found" });
+                }
+            });
+        }
+
+        // Handle child-level patches: [op, index?, html?] applied in order
+        if (update.patch) {
+            Object.entries(update.patch).forEach(([elementId, ops]) => {
+                const targetElement = document.getElementById(elementId);
+                if (!targetElement) {
+                    send(elt, "html-error", { elementId, error: "Element not found" });
+                    return;
+                }
+                const parse = (html) => {
+                    const tpl = document.createElement('template');
+                    tpl.innerHTML = expand(html);
+                    return tpl.content;
+                };
+                ops.forEach(([op, index, arg]) => {
+                    const children = targetElement.children;
+                    if (op === 'append') {
+                        targetElement.appendChild(parse(index));
+                    } else if (op === 'insert') {
+                        targetElement.insertBefore(parse(arg), children[index] || null);
+                    } else if (op === 'replace') {
+                        if (children[index]) children[index].replaceWith(parse(arg));
+                    } else if (op === 'remove') {
+                        for (let i = 0; i < arg && children[index]; i++) {
+                            children[index].remove();
+                        }
+                    }
+                });
+                send(elt, "html-updated", { elementId, targetElement });
+            });
+        }
+
+        // Handle JS updates (after HTML so scripts see the new DOM)
+        if (update.js) {
+            Object.entries(update.js).forEach(([key, value]) => {
+                if (key === 'exec') {
+                    // Execute JavaScript code, in order for batched frames
+                    [].concat(value).forEach((code) => {
+                        eval(code);
+                        send(elt, "js-exec", { code });
+                    });
+                } else {
+                    // Set window variables
+                    window[key] = value;
+                    send(elt, "js-var", { key, value });
+                }
+            });
+        }
+        
+        send(elt, "processed", { update });
+    };
+    
     // Initialize SSE connection for element
     let initSSE = (elt) => {
         if (elt.__ssexi || ignore(elt) || !send(elt, "init", {})) return;
@@ -90,79 +222,23 @@
             connections.get(endpoint).close();
         }
         
-        // Create new EventSource
-        let eventSource = new EventSource(endpoint);
+        // Create new EventSource, resuming after the last event we saw (at
+        // first, the one the server built the page at)
+        elt.__ssexi_last_id = elt.__ssexi_last_id || attr(elt, "sx-last-event-id");
+        let url = withTemplates(endpoint);
+        if (elt.__ssexi_last_id) {
+            url += "&lastEventId=" + encodeURIComponent(elt.__ssexi_last_id);
+        }
+        let eventSource = new EventSource(url);
         connections.set(endpoint, eventSource);
         
         // Message handler - supports your SSE message format
         eventSource.onmessage = (event) => {
             try {
+                if (event.lastEventId) elt.__ssexi_last_id = event.lastEventId;
                 const update = JSON.parse(event.data);
                 
-                if (!send(elt, "message", { update, endpoint })) return;
-                
-                // Handle JS updates
-                if (update.js) {
-                    Object.entries(update.js).forEach(([key, value]) => {
-                        if (key === 'exec') {
-                            // Execute JavaScript code
-                            eval(value);
-                            send(elt, "js-exec", { code: value });
-                        } else {
-                            // Set window variables
-                            window[key] = value;
-                            send(elt, "js-var", { key, value });
-                        }
-                    });
-                }
-                
-                // Handle HTML updates
-                if (update.html) {
-                    Object.entries(update.html).forEach(([elementId, htmlContent]) => {
-                        const targetElement = document.getElementById(elementId);
-                        if (targetElement) {
-                            const doUpdate = () => {
-                                const temp = document.createElement('div');
-                                temp.innerHTML = htmlContent;
-                                const newElement = temp.querySelector(targetElement.tagName);
-                                
-                                if (newElement) {
-                                    // Clear existing content
-                                    while (targetElement.firstChild) {
-                                        targetElement.removeChild(targetElement.firstChild);
-                                    }
-                                    
-                                    // Move new content
-                                    while (newElement.firstChild) {
-                                        targetElement.appendChild(newElement.firstChild);
-                                    }
-                                    
-                                    // Preserve ID and update other attributes
-                                    const originalId = targetElement.id;
-                                    while (targetElement.attributes.length > 0) {
-                                        targetElement.removeAttribute(targetElement.attributes[0].name);
-                                    }
-                                    targetElement.id = originalId;
-                                    
-                                    Array.from(newElement.attributes).forEach(attr => {
-                                        if (attr.name !== 'id') {
-                                            targetElement.setAttribute(attr.name, attr.value);
-                                        }
-                                    });
-                                    
-                                    send(elt, "html-updated", { elementId, targetElement });
-                                }
-                            };
-                            
-                            // Simple update without view transitions
-                            doUpdate();
-                        } else {
-                            send(elt, "html-error", { elementId, error: "Element not found" });
-                        }
-                    });
-                }
-                
-                send(elt, "processed", { update });
+                applyUpdate(elt, update, endpoint);
                 
             } catch (error) {
                 send(elt, "parse-error", { error, data: event.data });
@@ -172,12 +248,17 @@
         // Error handler with auto-reconnect
         eventSource.onerror = (error) => {
             send(elt, "error", { error, endpoint });
+            
+            // The browser is already reconnecting, honouring the server's retry: hint
+            if (eventSource.readyState === EventSource.CONNECTING) return;
+            
             eventSource.close();
             connections.delete(endpoint);
             
             // Auto-reconnect after 5 seconds
             setTimeout(() => {
                 if (document.contains(elt) && !ignore(elt)) {
+                    elt.__ssexi = false;
                     initSSE(elt);
                 }
             }, 5000);
@@ -190,16 +271,148 @@
         
         send(elt, "initialized", { endpoint });
     };
-    
+
+    // Multiplexed channels: [sx-channel] elements share one EventSource per
+    // sx-mux endpoint, and each channel's frames arrive as SSE events named
+    // after it
+    let muxes = new Map();
+
+    let muxPost = (mux, action, channel) => {
+        // Before the server has named the connection, the hello handler sends it
+        if (!mux.id) return;
+        fetch(mux.endpoint + "/" + mux.id + "/" + action, {
+            method: 'POST',
+            body: new URLSearchParams({ channel })
+        }).catch((error) => send(document.body, "error", { error, endpoint: mux.endpoint }));
+    };
+
+    let muxListen = (mux, channel) => {
+        let handler = (event) => {
+            let elts = mux.channels.get(channel);
+            if (!elts || !elts.size) return;
+            let elt = elts.values().next().value;
+            if (event.lastEventId) mux.lastEventId = event.lastEventId;
+            try {
+                applyUpdate(elt, JSON.parse(event.data), mux.endpoint + "#" + channel);
+            } catch (error) {
+                send(elt, "parse-error", { error, data: event.data });
+            }
+        };
+        mux.handlers.set(channel, handler);
+        mux.source.addEventListener(channel, handler);
+    };
+
+    let muxOpen = (mux) => {
+        let opened = Array.from(mux.channels.keys());
+        if (!opened.length) {
+            muxes.delete(mux.endpoint);
+            return;
+        }
+        let url = withTemplates(mux.endpoint + "?channels=" + encodeURIComponent(opened.join(",")));
+        // Resume after the last event we saw, as the browser's own reconnects do
+        if (mux.lastEventId) url += "&lastEventId=" + encodeURIComponent(mux.lastEventId);
+        let source = new EventSource(url);
+        mux.source = source;
+        mux.id = null;
+        mux.handlers = new Map();
+        opened.forEach((channel) => muxListen(mux, channel));
+
+        // The server names the connection first; reconcile channels added or
+        // dropped since the URL was built (also after browser reconnects)
+        source.addEventListener("sx-mux", (event) => {
+            mux.id = JSON.parse(event.data).id;
+            mux.channels.forEach((elts, channel) => {
+                if (!opened.includes(channel)) muxPost(mux, "subscribe", channel);
+            });
+            opened.forEach((channel) => {
+                if (!mux.channels.has(channel)) muxPost(mux, "unsubscribe", channel);
+            });
+            send(document.body, "connected", { endpoint: mux.endpoint, channels: Array.from(mux.channels.keys()) });
+        });
+
+        source.onerror = (error) => {
+            send(document.body, "error", { error, endpoint: mux.endpoint });
+            mux.id = null;
+            if (source.readyState === EventSource.CONNECTING) return;
+
+            source.close();
+            mux.source = null;
+            setTimeout(() => muxOpen(mux), 5000);
+        };
+    };
+
+    let subscribe = (channel, elt, endpoint = "/mux") => {
+        let mux = muxes.get(endpoint);
+        if (!mux) {
+            mux = { endpoint, channels: new Map(), handlers: new Map(), source: null, id: null, lastEventId: null };
+            muxes.set(endpoint, mux);
+            // Open once the current pass has found all its channels
+            setTimeout(() => muxOpen(mux), 0);
+        }
+        let elts = mux.channels.get(channel);
+        if (!elts) {
+            mux.channels.set(channel, elts = new Set());
+            if (mux.source) {
+                muxListen(mux, channel);
+                muxPost(mux, "subscribe", channel);
+            }
+        }
+        elts.add(elt);
+        send(elt, "subscribed", { channel, endpoint });
+    };
+
+    let unsubscribe = (channel, elt, endpoint = "/mux") => {
+        let mux = muxes.get(endpoint);
+        let elts = mux && mux.channels.get(channel);
+        if (!elts || !elts.delete(elt) || elts.size) return;
+        // Wait a tick: a swap removes elements before adding their replacements
+        setTimeout(() => {
+            if (elts.size || mux.channels.get(channel) !== elts) return;
+            mux.channels.delete(channel);
+            if (mux.source) {
+                mux.source.removeEventListener(channel, mux.handlers.get(channel));
+                mux.handlers.delete(channel);
+                muxPost(mux, "unsubscribe", channel);
+            }
+        }, 0);
+    };
+
+    // Subscribe element to its channel
+    let initChannel = (elt) => {
+        if (elt.__ssexi_channel || ignore(elt) || !send(elt, "channel-init", {})) return;
+
+        let channel = attr(elt, "sx-channel");
+        if (!channel) return;
+
+        elt.__ssexi_channel = { channel, endpoint: attr(elt, "sx-mux", "/mux") };
+        subscribe(channel, elt, elt.__ssexi_channel.endpoint);
+        
+        // Channels in the opening URL resume from the event the page was built at
+        let mux = muxes.get(elt.__ssexi_channel.endpoint);
+        if (!mux.source && !mux.lastEventId) mux.lastEventId = attr(elt, "sx-last-event-id", null);
+    };
+
+    // Unsubscribe channel elements removed from the page
+    let cleanup = (n) => {
+        if (!n.querySelectorAll || document.contains(n)) return;
+        [n, ...n.querySelectorAll("[sx-channel]")].forEach((elt) => {
+            if (!elt.__ssexi_channel) return;
+            unsubscribe(elt.__ssexi_channel.channel, elt, elt.__ssexi_channel.endpoint);
+            elt.__ssexi_channel = null;
+        });
+    };
+
     // Process element and its children
     let process = (n) => {
         if (n.matches) {
             if (ignore(n)) return;
             if (n.matches("[sx-connect]")) initSSE(n);
+            if (n.matches("[sx-channel]")) initChannel(n);
             if (n.matches("[sx-post]")) initForm(n);
         }
         if (n.querySelectorAll) {
             n.querySelectorAll("[sx-connect]").forEach(initSSE);
+            n.querySelectorAll("[sx-channel]").forEach(initChannel);
             n.querySelectorAll("[sx-post]").forEach(initForm);
         }
     };
@@ -211,6 +424,8 @@
     window.addEventListener("beforeunload", () => {
         connections.forEach(conn => conn.close());
         connections.clear();
+        muxes.forEach(mux => mux.source && mux.source.close());
+        muxes.clear();
     });
     
     // Initialize when DOM is ready
@@ -226,6 +441,9 @@
     window.SSEXI = {
         process,
         connections,
+        muxes,
+        subscribe,
+        unsubscribe,
         version: "1.0.0"
     };
 })();
\ No newline at end of file